@@ -1,18 +1,18 @@
-import random
-from aqt.qt import Qt, qconnect, QFontDatabase, QGridLayout, QListWidgetItem, QListWidget, QPushButton, QLabel, QLineEdit, QWidget, QFont, QVBoxLayout, QTabWidget, QStackedWidget, QComboBox, QMessageBox, QAction
+from aqt.qt import Qt, qconnect, QFontDatabase, QGridLayout, QListWidgetItem, QListWidget, QPushButton, QLabel, QLineEdit, QWidget, QFont, QVBoxLayout, QTabWidget, QStackedWidget, QComboBox, QMessageBox, QAction, QHBoxLayout, QInputDialog
 from aqt import mw
+from .diagnosticsPanel import DiagnosticsPanel
 from .finderPanels import DefaultFinderPanel
-from .utils import ConfigPath
-
-writingSystems = {QFontDatabase.writingSystemName(v): v for v in QFontDatabase.writingSystems()}
-writingSystems = dict(sorted(writingSystems.items()))  # Sort alphabetically by language name rather than int value
+from .fontTable import writingSystems, fontCatalog
+from .lookahead import ReviewLookahead
+from .runtime import RandomFontRuntime
+from .utils import ConfigPath, configSnapshot
 
 
 class StackWidget(QWidget):
     def __init__(self, language, configRoot):
         super().__init__()
         self.language = language
-        fonts = QFontDatabase.families(writingSystems[self.language])
+        fonts = fontCatalog.get(self.language)
         self.config = configRoot.addBranch(language, {font: True for font in fonts})
 
         # Create widgets
@@ -25,15 +25,20 @@ class StackWidget(QWidget):
         self.example = QLineEdit()
 
         # Populate font list
+        self.checkStates = {}  # Kept in sync with the list's check boxes so it never has to be scanned
+        saved = self.config.read()
         for font in fonts:
             listItem = QListWidgetItem(font, self.fontList)
-            checkState = self.config.read(font)
+            checkState = saved[font]
             listItem.setCheckState(Qt.CheckState.Checked if checkState else Qt.CheckState.Unchecked)
+            self.checkStates[font] = bool(checkState)
+        self.updateEnabledFonts()
 
         # Connect slots to signals
         self.enableBtn.pressed.connect(self.enablePressed)
         self.disableBtn.pressed.connect(self.disablePressed)
         self.fontList.currentItemChanged.connect(self.fontSelected)
+        self.fontList.itemChanged.connect(self.itemChanged)
 
         # Finishing touches
         self.fontList.setCurrentRow(0)
@@ -49,12 +54,27 @@ class StackWidget(QWidget):
         self.layout.addWidget(self.example, 5, 1, 1, 3)
 
     def enablePressed(self):
-        for f in self.fontListItems():
-            f.setCheckState(Qt.CheckState.Checked)
+        self.setAllCheckStates(True)
 
     def disablePressed(self):
+        self.setAllCheckStates(False)
+
+    def setAllCheckStates(self, checked):
+        # Block itemChanged so the enabled fonts are only recalculated once rather than once per font
+        self.fontList.blockSignals(True)
         for f in self.fontListItems():
-            f.setCheckState(Qt.CheckState.Unchecked)
+            f.setCheckState(Qt.CheckState.Checked if checked else Qt.CheckState.Unchecked)
+        self.fontList.blockSignals(False)
+        self.fontList.viewport().update()
+        self.checkStates = dict.fromkeys(self.checkStates, checked)
+        self.updateEnabledFonts()
+
+    def itemChanged(self, item):
+        self.checkStates[item.text()] = item.checkState() == Qt.CheckState.Checked
+        self.updateEnabledFonts()
+
+    def updateEnabledFonts(self):
+        self.enabled = tuple(font for font, checked in self.checkStates.items() if checked)
 
     def fontSelected(self, currentItem):
         self.example.setFont(QFont(currentItem.text()))
@@ -63,21 +83,16 @@ class StackWidget(QWidget):
         return [self.fontList.item(i) for i in range(self.fontList.count())]
 
     def enabledFonts(self):
-        return [f.text() for f in self.fontListItems() if f.checkState() == Qt.CheckState.Checked]
+        return self.enabled
 
     def writeConfig(self):
-        pairs = []
-        for f in self.fontListItems():
-            if f.checkState() == Qt.CheckState.Checked:
-                pairs.append((f.text(), True))
-            else:
-                pairs.append((f.text(), False))
-        self.config.writes(pairs)
+        self.config.writes(self.checkStates.items())
 
 
 class RandomFontConfigWidget(QWidget):
-    def __init__(self):
+    def __init__(self, runtime):
         super().__init__()
+        self.runtime = runtime
         self.config = ConfigPath()
         self.panelsConfig = self.config.addBranch('panels')
         self.languagesConfig = self.config.addBranch('languages')
@@ -87,8 +102,23 @@ class RandomFontConfigWidget(QWidget):
         # Create widgets
         self.layout = QVBoxLayout(self)
         self.tabWidget = QTabWidget()
-        self.finderPanel = DefaultFinderPanel(self.modifyQ, self.modifyA, self.panelsConfig, 'RandomFont')
-        self.tabWidget.addTab(self.finderPanel, 'Search')
+        self.searchTab = QWidget()
+        self.searchTabLayout = QVBoxLayout(self.searchTab)
+        self.panelList = QComboBox()
+        self.addPanelBtn = QPushButton('Add Panel')
+        self.removePanelBtn = QPushButton('Remove Panel')
+        self.panelBtnLayout = QHBoxLayout()
+        self.panelBtnLayout.addWidget(self.panelList)
+        self.panelBtnLayout.addWidget(self.addPanelBtn)
+        self.panelBtnLayout.addWidget(self.removePanelBtn)
+        self.panelStack = QStackedWidget()
+        self.searchTabLayout.addLayout(self.panelBtnLayout)
+        self.searchTabLayout.addWidget(self.panelStack)
+        self.tabWidget.addTab(self.searchTab, 'Search')
+        self.finderPanels = []
+        self.removedPanels = []  # Only deleted from config on Save
+        for name in self.panelsConfig.read() or [self.runtime.panelName]:
+            self.addFinderPanel(name)
         self.stack = QStackedWidget()
         self.languageList = QComboBox()
         self.secondTab = QWidget()
@@ -96,85 +126,106 @@ class RandomFontConfigWidget(QWidget):
         self.secondTabLayout.addWidget(self.languageList)
         self.secondTabLayout.addWidget(self.stack)
         self.tabWidget.addTab(self.secondTab, 'Configure Fonts')
+        self.diagnosticsPanel = DiagnosticsPanel(self.config, self.runtime)
+        self.tabWidget.addTab(self.diagnosticsPanel, 'Diagnostics')
         self.saveBtn = QPushButton('Save')
 
         for wsName, wsValue in writingSystems.items():
             self.languageList.addItem(wsName)
             self.stack.addWidget(StackWidget(wsName, self.languagesConfig))
+        fontCatalog.save()
 
         self.saveBtn.pressed.connect(self.saveBtnPushed)
+        self.panelList.currentIndexChanged.connect(self.panelChanged)
+        self.addPanelBtn.pressed.connect(self.addPanelPressed)
+        self.removePanelBtn.pressed.connect(self.removePanelPressed)
         self.languageList.currentIndexChanged.connect(self.languageChanged)
+        self.tabWidget.currentChanged.connect(self.tabChanged)
 
         self.layout.addWidget(self.tabWidget)
         self.layout.addWidget(self.saveBtn)
 
     def saveBtnPushed(self):
-        self.finderPanel.writeConfig()
+        # Refuse to save a search the reviewer couldn't compile, or languages it couldn't give fonts to
+        for panel in self.finderPanels:
+            error = panel.patternError() or panel.languagesError()
+            if error:
+                QMessageBox.warning(self, 'Not saved', f'{panel.name}: {error}')
+                return
+        for panel in self.removedPanels:
+            panel.config.delete()
+        self.removedPanels = []
+        for panel in self.finderPanels:
+            panel.writeConfig()
+        self.diagnosticsPanel.writeConfig()
         for i in range(self.stack.count()):
-            self.stack.widget(i).writeConfig()
+            widget = self.stack.widget(i)
+            widget.writeConfig()
+            self.runtime.fontTable.setEnabledFonts(widget.language, widget.enabledFonts())
+        # Everything above only changed the in-memory config, so this is the one write to disk
+        self.config.flush()
+        self.runtime.reloadRule()
         QMessageBox.about(self, 'Saved!', 'Saved!')
 
+    def addFinderPanel(self, name):
+        panel = DefaultFinderPanel(self.panelsConfig, name)
+        self.finderPanels.append(panel)
+        self.panelStack.addWidget(panel)
+        self.panelList.addItem(name)
+
+    def panelChanged(self, i):
+        self.panelStack.setCurrentIndex(i)
+
+    def addPanelPressed(self):
+        name, ok = QInputDialog.getText(self, 'Add Panel', 'Panel name:')
+        name = name.strip()
+        if not ok or not name:
+            return
+        if any(panel.name == name for panel in self.finderPanels):
+            QMessageBox.warning(self, 'Add Panel', f'There is already a panel called {name}')
+            return
+        self.addFinderPanel(name)
+        self.panelList.setCurrentIndex(self.panelList.count() - 1)
+
+    def removePanelPressed(self):
+        if len(self.finderPanels) == 1:
+            return
+        i = self.panelList.currentIndex()
+        panel = self.finderPanels.pop(i)
+        self.panelStack.removeWidget(panel)
+        self.panelList.removeItem(i)
+        self.removedPanels.append(panel)
+
     def languageChanged(self, i):
         self.stack.setCurrentIndex(i)
 
-    def modifyQ(self, text):
-        styles = ''
-        for i in range(self.stack.count()):
-            widget = self.stack.widget(i)
-            language = widget.language
-
-            # Assume checking for the name of the language on the card is more performant
-            if language not in text:
-                continue
-
-            enabledFonts = widget.enabledFonts()
-            if enabledFonts:
-                chosenFont = random.choice(enabledFonts)
-            else:  # Fallback to default font
-                chosenFont = QFontDatabase.systemFont(QFontDatabase.GeneralFont).family()
-
-            # Add a hidden tooltip to show name of font. User to show it with css if wanted.
-            text = text + '''
-                <span id="{language}FontName" class="tippyhover" style="display:none;">
-                    <ruby><rb>{language}Font</rb><rt>{font}</rt></ruby>
-                </span>
-                <script>
-                    var {language}ChosenFont = "{font}";
-                    var {language}Tooltip = document.getElementById("{language}FontName");
-                </script>
-            '''.format(language=language, font=chosenFont)
-
-            # Add css rule to apply the random font to things with the language name as a class
-            styles = styles + f".{language} {{font-family: {chosenFont};}}"
-
-        # Apply the css rules
-        text = text + '''
-            <script>
-                /* If I add this to qa instead of document, the stylesheet apparently gets deleted
-                   when a new card is shown, which is what I want */
-                var qa = document.getElementById("qa");
-                var randomFontStyleSheet = document.createElement("style");
-                randomFontStyleSheet.innerText = "{}";
-                qa.appendChild(randomFontStyleSheet);
-            </script>
-        '''.format(styles)
-
-        return text
-
-    def modifyA(self, text):
-        for i in range(self.stack.count()):
-            language = self.stack.widget(i).language
-            if language not in text:
-                continue
-            text = text + f'<script>qa.append({language}Tooltip);</script>'
-        return text + '<script>qa.appendChild(randomFontStyleSheet);</script>'
+    def tabChanged(self, i):
+        if self.tabWidget.widget(i) is self.diagnosticsPanel:
+            self.diagnosticsPanel.refresh()
 
 
 def showConfig():
-    widget.show()
-
-
-mw.myfw = widget = RandomFontConfigWidget()
+    # Only build the config GUI (and enumerate every installed font) once the user actually asks for it
+    if mw.myfw is None:
+        mw.myfw = RandomFontConfigWidget(runtime)
+    mw.myfw.show()
+
+
+def configUpdated(config):
+    # Edited through Anki's own config editor, so everything read from the old config is stale
+    configSnapshot.replace(config)
+    runtime.reload()
+    if mw.myfw is not None:
+        mw.myfw.close()
+        mw.myfw = None
+
+
+mw.myfw = None
+runtime = RandomFontRuntime()
+runtime.register()
+lookahead = ReviewLookahead(runtime)
+lookahead.register()
 action = QAction('Configure Random Fonts', mw)
 qconnect(action.triggered, showConfig)
 mw.form.menuTools.addAction(action)
+mw.addonManager.setConfigUpdatedAction(__name__, configUpdated)
@@ -0,0 +1,79 @@
+'''
+Times the per-card pattern matching of a literal-heavy rule set (the kind most users have) three ways: re.search
+on the pattern string as the finders originally did, precompiled regexes, and patterns.compilePattern. Checks
+that compilePattern agrees with re.search first.
+
+    python benchmarks/benchPatterns.py
+'''
+import random
+import re
+import timeit
+from fakeAnki import importAddonModule
+
+patterns = importAddonModule('patterns')
+
+# What one card puts through the patterns: field names until one matches, the matched field's text and the tags
+fieldNames = ['Expression', 'Meaning', 'Reading', 'Audio', 'Image', 'Sentence', 'Sentence-Meaning', 'Notes']
+ruleSet = {
+    'fieldName': '^Sentence$',
+    'contents': '日本',
+    'tags': ['JLPT', 'N5', 'verb$', 'Core2k'],
+}
+
+
+def buildCards(size, seed=0):
+    rng = random.Random(seed)
+    words = ['日本', '語', 'を', '勉強', 'する', 'the', 'quick', 'brown', 'fox', '東京', 'に', '行く']
+    tags = ['JLPT::N5', 'JLPT::N4', 'Core2k', 'Core6k', 'verb', 'noun', 'adjective', 'leech', 'marked', 'audio']
+    return [
+        (''.join(rng.choice(words) for _ in range(rng.randint(3, 20))), rng.sample(tags, rng.randint(1, 6)))
+        for _ in range(size)
+    ]
+
+
+def checkCards(cards, search):
+    fieldPattern, contentsPattern, tagPatterns = search
+    for text, tags in cards:
+        for name in fieldNames:
+            if fieldPattern(name):
+                break
+        contentsPattern(text)
+        for p in tagPatterns:
+            any(p(t) for t in tags)
+
+
+def main():
+    probes = ['', 'Sentence', 'Sentence\n', 'Sentence-Meaning', 'x日本', 'verb', 'verbs', 'verb\n', 'JLPT::N5', 'Core2k']
+    literal = [ruleSet['fieldName'], ruleSet['contents'], *ruleSet['tags'], '^N5', 'Core']
+    regex = ['a.b', 'x|y', '[日本]', r'\d+']
+    for pattern in literal + regex:
+        for probe in probes:
+            if bool(patterns.compilePattern(pattern).search(probe)) != bool(re.search(pattern, probe)):
+                raise SystemExit(f'mismatch: {pattern!r} on {probe!r}')
+    print(f'literal patterns: {sum(not isinstance(patterns.compilePattern(p), re.Pattern) for p in literal)}/{len(literal)} detected')
+
+    cards = buildCards(20000)
+    searches = (
+        ('re.search', (
+            lambda s: re.search(ruleSet['fieldName'], s),
+            lambda s: re.search(ruleSet['contents'], s),
+            [lambda s, p=p: re.search(p, s) for p in ruleSet['tags']],
+        )),
+        ('precompiled', (
+            re.compile(ruleSet['fieldName']).search,
+            re.compile(ruleSet['contents']).search,
+            [re.compile(p).search for p in ruleSet['tags']],
+        )),
+        ('compilePattern', (
+            patterns.compilePattern(ruleSet['fieldName']).search,
+            patterns.compilePattern(ruleSet['contents']).search,
+            [patterns.compilePattern(p).search for p in ruleSet['tags']],
+        )),
+    )
+    for name, search in searches:
+        seconds = min(timeit.repeat(lambda: checkCards(cards, search), number=1, repeat=5))
+        print(f'{name:>16}: {seconds / len(cards) * 1e6:7.2f} us/card')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''
+Size and build time of the HTML added to a card by modifyQ/modifyA, compared with the previous per-language
+format string version, for cards using more and more language classes.
+
+    python benchmarks/benchPayload.py
+'''
+import random
+import timeit
+from fakeAnki import importAddonModule
+
+runtimeModule = importAddonModule('runtime')
+writingSystems = importAddonModule('fontTable').writingSystems
+
+
+def originalModifyQ(fontTable, text):
+    styles = ''
+    for language in writingSystems:
+        if language not in text:
+            continue
+        chosenFont = fontTable.chooseFont(language)
+        text = text + '''
+                <span id="{language}FontName" class="tippyhover" style="display:none;">
+                    <ruby><rb>{language}Font</rb><rt>{font}</rt></ruby>
+                </span>
+                <script>
+                    var {language}ChosenFont = "{font}";
+                    var {language}Tooltip = document.getElementById("{language}FontName");
+                </script>
+            '''.format(language=language, font=chosenFont)
+        styles = styles + f".{language} {{font-family: {chosenFont};}}"
+    text = text + '''
+            <script>
+                /* If I add this to qa instead of document, the stylesheet apparently gets deleted
+                   when a new card is shown, which is what I want */
+                var qa = document.getElementById("qa");
+                var randomFontStyleSheet = document.createElement("style");
+                randomFontStyleSheet.innerText = "{}";
+                qa.appendChild(randomFontStyleSheet);
+            </script>
+        '''.format(styles)
+    return text
+
+
+def originalModifyA(text):
+    for language in writingSystems:
+        if language not in text:
+            continue
+        text = text + f'<script>qa.append({language}Tooltip);</script>'
+    return text + '<script>qa.appendChild(randomFontStyleSheet);</script>'
+
+
+def buildCard(languages):
+    return ''.join(f'<div class="{language}">{language} text</div>' for language in languages)
+
+
+def main():
+    runtime = runtimeModule.RandomFontRuntime()
+    for language in writingSystems:
+        runtime.fontTable.setEnabledFonts(language, [f'{language} Font {i}' for i in range(300)])
+
+    languages = [language for language in writingSystems if ' ' not in language]
+    random.Random(0).shuffle(languages)
+    print(f'{"languages":>9} | {"old bytes":>9} {"new bytes":>9} | {"old us":>8} {"new us":>8}')
+    for count in (1, 2, 4, 8):
+        card = buildCard(languages[:count])
+        oldSize = len(originalModifyQ(runtime.fontTable, card)) + len(originalModifyA(card)) - 2 * len(card)
+        fonts = runtime.chooseFonts(runtimeModule.usedLanguages(card))
+        newSize = len(runtime.modifyQ(card, fonts)) + len(runtime.modifyA(card, fonts)) - 2 * len(card)
+        oldTime = min(timeit.repeat(lambda: (originalModifyQ(runtime.fontTable, card), originalModifyA(card)), number=1000, repeat=5))
+        newTime = min(timeit.repeat(lambda: (runtime.modifyQ(card, runtime.chooseFonts(runtimeModule.usedLanguages(card))), runtime.modifyA(card, fonts)), number=1000, repeat=5))
+        print(f'{count:>9} | {oldSize:>9} {newSize:>9} | {oldTime * 1e3:>8.2f} {newTime * 1e3:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+'''
+Compares utils.strip_tags against the original MLStripper-per-call implementation. Checks both give the same
+output on a corpus of typical field contents first, then times them.
+
+    python benchmarks/benchStripTags.py
+'''
+import random
+import re
+import timeit
+from fakeAnki import importAddonModule
+
+utils = importAddonModule('utils')
+
+
+def originalStripTags(html):
+    s = utils.MLStripper()
+    s.feed(html)
+    return re.sub(r'\[(.*?)\]', '', s.get_data())
+
+
+def buildCorpus(size, seed=0):
+    rng = random.Random(seed)
+    pieces = [
+        '漢字[かんじ]', '日本語[にほんご]', 'word', 'the quick brown fox', '&nbsp;', '&lt;tag&gt;', '&amp;', '1 < 2',
+        '<b>', '</b>', '<i>', '</i>', '<br>', '<br/>', '<div>', '</div>', '<span style="color: rgb(0, 0, 255);">',
+        '</span>', '<ruby>', '<rt>', '</rt>', '</ruby>', '<img src="paste-1.jpg">', '[sound:word.mp3]',
+    ]
+    corpus = [''.join(rng.choice(pieces) for _ in range(rng.randint(1, 30))) for _ in range(size)]
+    # Rarer things the fast path hands over to HTMLParser, which still have to come out the same
+    return corpus + ['<!-- x -->a', 'a<', '1&2', '<script>a<b</script>z', '<a title=">">t</a>', 'x &amp', '<>']
+
+
+def main():
+    corpus = buildCorpus(5000)
+    mismatches = [html for html in corpus if utils.strip_tags(html) != originalStripTags(html)]
+    fallbacks = sum(utils.fastStrip(html) is None for html in corpus)
+    print(f'corpus: {len(corpus)} fields, {len(mismatches)} mismatches, {fallbacks} fell back to HTMLParser')
+    if mismatches:
+        raise SystemExit(f'first mismatch: {mismatches[0]!r}')
+
+    def uncached():
+        for html in corpus:
+            utils.stripCache.clear()
+            utils.strip_tags(html)
+
+    def cached():
+        for html in corpus:
+            utils.strip_tags(html)
+
+    timings = (
+        ('original', lambda: [originalStripTags(html) for html in corpus]),
+        ('fast, uncached', uncached),
+        ('fast, memoized', cached),
+    )
+    for name, func in timings:
+        seconds = min(timeit.repeat(func, number=1, repeat=5))
+        print(f'{name:>16}: {seconds / len(corpus) * 1e6:7.2f} us/field')
+
+
+if __name__ == '__main__':
+    main()
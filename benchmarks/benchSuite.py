@@ -0,0 +1,162 @@
+'''
+Headless performance suite. Generates collections of a few sizes and, for a handful of representative rule
+sets, reports the card_will_show hook's latency per card (question and answer side) and how fast a preview
+search gets through the collection. Run it before a release and compare with the previous version's numbers.
+
+    python benchmarks/benchSuite.py
+    python benchmarks/benchSuite.py --sizes 10000,100000,500000 --cards 5000
+'''
+import argparse
+import glob
+import os
+import random
+import statistics
+import time
+import fakeAnki
+import fakeCollection
+
+runtimeModule = fakeAnki.importAddonModule('runtime')
+previewDialog = fakeAnki.importAddonModule('previewDialog')
+utils = fakeAnki.importAddonModule('utils')
+
+japaneseFields = '^(Expression|Vocabulary-Kanji)$'
+ruleSets = {
+    'deck literal': {
+        'widgets': {'Deck Name (regex)': {'enabled': True, 'text': 'Japanese'}},
+    },
+    'deck and tags': {
+        'logic': 1,
+        'widgets': {
+            'Deck Name (regex)': {'enabled': True, 'text': 'Japanese'},
+            'Tags (regex)': {'enabled': True, 'text': 'JLPT verb', 'logic': 0},
+        },
+    },
+    'note type or new, negated': {
+        'negate': True,
+        'widgets': {
+            'Note Type (regex)': {'enabled': True, 'text': 'Core2k'},
+            'Card States': {'enabled': True, 'options': [0]},
+        },
+    },
+    'success rate': {
+        'widgets': {'Success Rate': {'enabled': True, 'comparator': '>=', 'value': 80}},
+    },
+    'field length': {
+        'widgets': {'Field': {'enabled': True, 'nameText': japaneseFields, 'lengthEnabled': True, 'lengthComparator': '<=', 'lengthValue': 6}},
+    },
+    'field length, indexed': {
+        'widgets': {'Field': {'enabled': True, 'nameText': japaneseFields, 'lengthEnabled': True, 'lengthComparator': '<=', 'lengthValue': 6, 'useIndex': True}},
+    },
+    'field contents': {
+        'widgets': {'Field': {'enabled': True, 'nameText': japaneseFields, 'contentsEnabled': True, 'contentsText': '勉強する'}},
+    },
+    'field contents, indexed': {
+        'widgets': {'Field': {'enabled': True, 'nameText': japaneseFields, 'contentsEnabled': True, 'contentsText': '勉強する', 'useIndex': True}},
+    },
+}
+# Several profiles at once, sharing most of their finders, as the dispatcher is meant to handle
+multiPanelSets = {
+    'four panels, shared rules': {
+        'Kanji fields': {'priority': 3, 'languages': ['Japanese'], 'logic': 1, 'widgets': {
+            'Deck Name (regex)': {'enabled': True, 'text': 'Japanese'},
+            'Field': {'enabled': True, 'nameText': japaneseFields, 'kanjiEnabled': True, 'kanjiComparator': '>=', 'kanjiValue': 3},
+        }},
+        'JLPT verbs': {'priority': 2, 'logic': 1, 'widgets': {
+            'Deck Name (regex)': {'enabled': True, 'text': 'Japanese'},
+            'Tags (regex)': {'enabled': True, 'text': 'JLPT verb', 'logic': 0},
+        }},
+        'Well known': {'priority': 1, 'logic': 1, 'widgets': {
+            'Deck Name (regex)': {'enabled': True, 'text': 'Japanese'},
+            'Success Rate': {'enabled': True, 'comparator': '>=', 'value': 80},
+        }},
+        'Everything else': {'negate': True, 'widgets': {'Deck Name (regex)': {'enabled': True, 'text': 'Japanese'}}},
+    },
+}
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    return {p: ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] for p in (50, 90, 99)} | {100: ordered[-1]}
+
+
+def usePanels(runtime, panelsConfig):
+    utils.configSnapshot.replace({'panels': panelsConfig})
+    runtime.reloadRule()
+
+
+def hookLatencies(runtime, col, cids):
+    ''' Seconds spent in the hook for each card's question and answer, with nothing cached for the card yet. '''
+    runtime.collectionChanged()
+    questions, answers = [], []
+    for cid in cids:
+        card = col.get_card(cid)
+        text = col.questionHtml(card)
+        start = time.perf_counter()
+        shown = runtime.checkCard(text, card, 'reviewQuestion')
+        middle = time.perf_counter()
+        runtime.checkCard(shown, card, 'reviewAnswer')
+        end = time.perf_counter()
+        questions.append(middle - start)
+        answers.append(end - middle)
+    return questions, answers
+
+
+def previewTime(runtime):
+    ''' Seconds for a preview search of every panel over the whole collection, and the number of matches. '''
+    start = time.perf_counter()
+    matches = 0
+    for panel in runtime.dispatcher.panels:
+        cids, residualRule = previewDialog.candidateCards(panel)
+        matches += len(previewDialog.confirmMatches(residualRule, cids))
+    return time.perf_counter() - start, matches
+
+
+def removeIndexFiles(profileName):
+    for path in glob.glob(utils.userFilePath(f'noteFeatures-{profileName}.sqlite*')):
+        os.remove(path)
+
+
+def runSize(runtime, size, cardSamples):
+    start = time.perf_counter()
+    col = fakeCollection.buildCollection(size)
+    profileName = f'benchmark-{size}'
+    removeIndexFiles(profileName)
+    fakeAnki.useCollection(col, profileName)
+    allCids = col.find_cards('deck:*')
+    print(f'\n{len(allCids)} cards (generated in {time.perf_counter() - start:.1f}s)')
+    print(f'{"rule set":>26} | {"question us p50/p90/p99/max":>29} | {"answer us p50":>13} | {"preview s":>9} {"cold s":>7} {"cards/s":>9} {"matches":>8}')
+    cids = random.Random(size).sample(allCids, min(cardSamples, len(allCids)))
+    try:
+        panelSets = {name: {runtime.panelName: ruleConfig} for name, ruleConfig in ruleSets.items()} | multiPanelSets
+        for name, panelsConfig in panelSets.items():
+            usePanels(runtime, panelsConfig)
+            # The first preview also builds whatever the rules cache per collection (pass counts, feature index)
+            coldSeconds, matches = previewTime(runtime)
+            warmSeconds, matches = previewTime(runtime)
+            questions, answers = hookLatencies(runtime, col, cids)
+            q = percentiles([s * 1e6 for s in questions])
+            a = statistics.median(answers) * 1e6
+            question = '/'.join(f'{q[p]:.0f}' for p in (50, 90, 99, 100))
+            print(f'{name:>26} | {question:>29} | {a:>13.0f} | {warmSeconds:>9.3f} {coldSeconds:>7.2f} {len(allCids) / warmSeconds:>9.0f} {matches:>8}')
+    finally:
+        col.close()
+        removeIndexFiles(profileName)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10000,100000', help='comma separated card counts, e.g. 10000,100000,500000')
+    parser.add_argument('--cards', type=int, default=2000, help='cards sampled for hook latency per rule set')
+    args = parser.parse_args()
+
+    runtime = runtimeModule.RandomFontRuntime()
+    runtime.register()
+    # Give the languages the cards use fonts up front, so nothing enumerates or saves the font catalog
+    for language in ('Japanese', 'Latin'):
+        runtime.fontTable.setEnabledFonts(language, [f'{language} Font {i}' for i in range(300)])
+    for size in (int(s) for s in args.sizes.split(',')):
+        runSize(runtime, size, args.cards)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+'''
+Minimal stand-ins for Anki's aqt and anki modules, so that the add-on's modules can be imported and timed
+outside of Anki. Qt classes are empty placeholders; nothing here draws any GUI.
+'''
+import concurrent.futures
+import importlib
+import json
+import os
+import sys
+import types
+
+addonRoot = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+packageName = 'randomfont'
+
+
+class FakeQtType(type):
+    ''' Class attributes of a placeholder (enums like Qt.ItemDataRole.DisplayRole) are placeholders too. '''
+
+    def __getattr__(cls, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return placeholderClass(name)
+
+
+def placeholderClass(name):
+    return FakeQtType(name, (), {'__init__': lambda self, *args, **kwargs: None})
+
+
+class FakeQtModule(types.ModuleType):
+    ''' Hands out an empty placeholder class for any Qt name that's imported from it. '''
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        placeholder = placeholderClass(name)
+        setattr(self, name, placeholder)
+        return placeholder
+
+
+class FakeFontDatabase():
+    ''' A fixed set of writing systems, each with a few hundred made up fonts. '''
+    names = ['Any', 'Arabic', 'Cyrillic', 'Greek', 'Hebrew', 'Japanese', 'Korean', 'Latin', 'Simplified Chinese', 'Thai', 'Traditional Chinese', 'Vietnamese']
+    fontsPerWritingSystem = 300
+
+    @classmethod
+    def writingSystems(cls):
+        return list(range(len(cls.names)))
+
+    @classmethod
+    def writingSystemName(cls, writingSystem):
+        return cls.names[writingSystem]
+
+    @classmethod
+    def writingSystemSample(cls, writingSystem):
+        return 'Sample'
+
+    @classmethod
+    def families(cls, writingSystem=0):
+        if cls.names[writingSystem] == 'Any':
+            return [family for ws in cls.writingSystems()[1:] for family in cls.families(ws)]
+        return [f'{cls.names[writingSystem]} Font {i}' for i in range(cls.fontsPerWritingSystem)]
+
+    @classmethod
+    def systemFont(cls, font):
+        return types.SimpleNamespace(family=lambda: 'System Font')
+
+
+class FakeAddonManager():
+    ''' Keeps the add-on's config in memory instead of meta.json. '''
+
+    def __init__(self):
+        self.config = {}
+
+    def getConfig(self, module):
+        return json.loads(json.dumps(self.config))
+
+    def writeConfig(self, module, config):
+        self.config = json.loads(json.dumps(config))
+
+
+class FakeHooks():
+    ''' Every hook is a plain list, which is all the add-on does with them (append/remove). '''
+
+    def __getattr__(self, name):
+        hook = []
+        setattr(self, name, hook)
+        return hook
+
+
+class FakeTaskManager():
+    ''' Runs "background" work straight away on the calling thread, so timings include all of it. '''
+
+    def run_in_background(self, task, on_done=None):
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(task())
+        except Exception as e:
+            future.set_exception(e)
+        if on_done:
+            on_done(future)
+        return future
+
+    def run_on_main(self, closure):
+        closure()
+
+
+def install():
+    if packageName in sys.modules:
+        return
+    aqt = types.ModuleType('aqt')
+    aqt.mw = types.SimpleNamespace(
+        col=None,
+        addonManager=FakeAddonManager(),
+        pm=types.SimpleNamespace(name='benchmark'),
+        taskman=FakeTaskManager(),
+    )
+    aqt.gui_hooks = FakeHooks()
+    aqt.qt = FakeQtModule('aqt.qt')
+    aqt.qt.QFontDatabase = FakeFontDatabase
+    anki = types.ModuleType('anki')
+    anki.collection = types.ModuleType('anki.collection')
+    anki.collection.SearchNode = lambda **kwargs: kwargs
+    sys.modules.update({'aqt': aqt, 'aqt.qt': aqt.qt, 'anki': anki, 'anki.collection': anki.collection})
+
+    # Import the add-on's modules as a package without running its __init__, which sets up the menu action
+    package = types.ModuleType(packageName)
+    package.__path__ = [addonRoot]
+    sys.modules[packageName] = package
+
+
+def useCollection(col, profileName='benchmark'):
+    ''' Make col (see fakeCollection.py) the open collection, as if Anki had just loaded it. '''
+    install()
+    mw = sys.modules['aqt'].mw
+    mw.col = col
+    mw.pm.name = profileName
+    for hook in sys.modules['aqt'].gui_hooks.collection_did_load:
+        hook(col)
+
+
+def importAddonModule(name):
+    install()
+    return importlib.import_module(f'{packageName}.{name}')
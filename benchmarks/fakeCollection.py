@@ -0,0 +1,302 @@
+'''
+A generated stand-in for mw.col, backed by an SQLite database with the parts of Anki's schema the add-on reads
+(cards, notes, revlog) plus decks, note types and tags kept in Python. Its find_cards understands the searches
+the finder rules generate (did:, mid:, nid:, tag:, is:, negation, AND/OR and parentheses).
+
+    col = buildCollection(100000)
+    fakeAnki.useCollection(col)
+'''
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import types
+
+schema = '''
+    CREATE TABLE notes (id INTEGER PRIMARY KEY, mid INTEGER, mod INTEGER, tags TEXT, flds TEXT);
+    CREATE TABLE cards (
+        id INTEGER PRIMARY KEY, nid INTEGER, did INTEGER, odid INTEGER, ord INTEGER, mod INTEGER,
+        type INTEGER, queue INTEGER, reps INTEGER
+    );
+    CREATE TABLE revlog (id INTEGER PRIMARY KEY, cid INTEGER, ease INTEGER);
+    CREATE INDEX ix_cards_nid ON cards (nid);
+    CREATE INDEX ix_revlog_cid ON revlog (cid);
+'''
+deckNames = [
+    'Default', 'Japanese', 'Japanese::Core2k', 'Japanese::Core2k::Step 01', 'Japanese::Core2k::Step 02',
+    'Japanese::Kanji', 'Japanese::Grammar', 'Chinese', 'Chinese::HSK1', 'Chinese::HSK2', 'Korean',
+    'Spanish', 'Spanish::Verbs', 'Geography', 'Medicine',
+]
+filteredDeckNames = ['Filtered Deck 1', 'Leeches']
+noteTypes = {
+    'Basic': ['Front', 'Back'],
+    'Japanese (recognition)': ['Expression', 'Meaning', 'Reading'],
+    'Core2k': ['Vocabulary-Kanji', 'Vocabulary-Furigana', 'Vocabulary-English', 'Sentence-Kanji', 'Sentence-English', 'Notes'],
+    'Cloze': ['Text', 'Extra'],
+}
+noteTypeLanguages = {'Basic': 'Latin', 'Japanese (recognition)': 'Japanese', 'Core2k': 'Japanese', 'Cloze': 'Latin'}
+noteTypeCss = '.card { font-family: arial; font-size: 20px; text-align: center; color: black; background-color: white; }'
+templateScript = '<script>document.body.classList.add("template-loaded");</script>'  # Templates often carry one
+tagNames = [
+    'JLPT::N5', 'JLPT::N4', 'JLPT::N3', 'JLPT::N2', 'JLPT::N1', 'Core2k', 'Core6k', 'verb', 'noun', 'adjective',
+    'adverb', 'leech', 'marked', 'audio', 'HSK::1', 'HSK::2', 'kanji', 'grammar', 'geography', 'medicine',
+]
+words = [
+    '日本', '語', 'を', '勉強', 'する', '東京', 'に', '行く', '食べる', '新しい', '漢字[かんじ]', '中国', '学生',
+    'the', 'quick', 'brown', 'fox', 'word', 'meaning', 'example', 'sentence', '&nbsp;', '1 < 2',
+]
+markup = ['<b>', '</b>', '<i>', '</i>', '<br>', '<div>', '</div>', '<span style="color: rgb(0, 0, 255);">', '</span>']
+# Queue, type, chance
+cardStates = [(0, 0, 0.3), (1, 1, 0.05), (2, 2, 0.55), (3, 3, 0.02), (-1, 2, 0.08)]
+searchTokenPattern = re.compile(r'-(?=\()|\(|\)|-?"[^"]*"|[^\s()]+')
+
+
+class FakeDB():
+    ''' The subset of Anki's DBProxy the add-on uses. '''
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def scalar(self, sql, *args):
+        row = self.connection.execute(sql, args).fetchone()
+        return row[0] if row else None
+
+    def first(self, sql, *args):
+        row = self.connection.execute(sql, args).fetchone()
+        return list(row) if row else None
+
+    def all(self, sql, *args):
+        return [list(row) for row in self.connection.execute(sql, args)]
+
+    def list(self, sql, *args):
+        return [row[0] for row in self.connection.execute(sql, args)]
+
+
+class FakeNote():
+    def __init__(self, col, nid):
+        self.id = nid
+        self.mid, self.mod, tags, flds = col.db.first('SELECT mid, mod, tags, flds FROM notes WHERE id = ?', nid)
+        self.tags = tags.split()
+        self.fields = flds.split('\x1f')
+        self.col = col
+
+    def keys(self):
+        return [f['name'] for f in self.col.models.get(self.mid)['flds']]
+
+    def items(self):
+        return list(zip(self.keys(), self.fields))
+
+
+class FakeCard():
+    def __init__(self, col, cid):
+        row = col.db.first('SELECT id, nid, did, odid, ord, mod, type, queue, reps FROM cards WHERE id = ?', cid)
+        self.id, self.nid, self.did, self.odid, self.ord, self.mod, self.type, self.queue, self.reps = row
+        self.col = col
+
+    def note(self):
+        return FakeNote(self.col, self.nid)
+
+    def note_type(self):
+        return self.col.models.get(self.note().mid)
+
+    def template(self):
+        return self.note_type()['tmpls'][0]
+
+    def question(self):
+        return self.col.questionHtml(self)
+
+
+class FakeDecks():
+    def __init__(self, decks):
+        self.decks = decks  # did -> {'id', 'name', 'dyn'}
+
+    def get(self, did):
+        return self.decks.get(did)
+
+    def all_names_and_ids(self, include_filtered=True):
+        return [types.SimpleNamespace(id=d['id'], name=d['name']) for d in self.decks.values() if include_filtered or not d['dyn']]
+
+
+class FakeModels():
+    def __init__(self, models):
+        self.models = models  # mid -> {'id', 'name', 'flds', 'sortf', 'tmpls'}
+
+    def get(self, mid):
+        return self.models.get(mid)
+
+    def all(self):
+        return list(self.models.values())
+
+    def all_names_and_ids(self):
+        return [types.SimpleNamespace(id=m['id'], name=m['name']) for m in self.models.values()]
+
+
+class FakeTags():
+    def __init__(self, tags):
+        self.tags = tags
+
+    def all(self):
+        return list(self.tags)
+
+
+class FakeScheduler():
+    def __init__(self, col):
+        self.col = col
+
+    def get_queued_cards(self, fetch_limit=1, intraday_learning_only=False):
+        ''' The next due review cards, in the shape of Anki's QueuedCards (cards[i].card.id). '''
+        cids = self.col.db.list('SELECT id FROM cards WHERE queue = 2 ORDER BY id LIMIT ?', fetch_limit)
+        queued = [types.SimpleNamespace(card=types.SimpleNamespace(id=cid)) for cid in cids]
+        return types.SimpleNamespace(cards=queued)
+
+
+class FakeCollection():
+    def __init__(self, path, decks, models, tags):
+        self.path = path
+        self.db = FakeDB(sqlite3.connect(path, check_same_thread=False))
+        self.decks = FakeDecks(decks)
+        self.models = FakeModels(models)
+        self.tags = FakeTags(tags)
+        self.sched = FakeScheduler(self)
+
+    def get_card(self, cid):
+        return FakeCard(self, cid)
+
+    def get_note(self, nid):
+        return FakeNote(self, nid)
+
+    def questionHtml(self, card):
+        '''
+        A rendered question as card.question() returns it: the note type's CSS in a <style>, then the template
+        with its first field inside a div with a language class.
+        '''
+        note = card.note()
+        model = self.models.get(note.mid)
+        question = model['tmpls'][0]['qfmt'].replace('{{%s}}' % note.keys()[0], note.fields[0])
+        return f'<style>{model["css"]}</style>{question}'
+
+    def build_search_string(self, node):
+        return '"tag:{}"'.format(node['tag'])
+
+    def find_cards(self, search):
+        tokens = searchTokenPattern.findall(search)
+        where, args, position = self.parseOr(tokens, 0)
+        if position != len(tokens):
+            raise Exception(f'Unparsed search: {search}')
+        sql = f'SELECT c.id FROM cards c JOIN notes n ON n.id = c.nid WHERE {where} ORDER BY c.id'
+        return self.db.list(sql, *args)
+
+    def parseOr(self, tokens, position):
+        clauses, args = [], []
+        while True:
+            where, termArgs, position = self.parseAnd(tokens, position)
+            clauses.append(where)
+            args += termArgs
+            if position < len(tokens) and tokens[position] == 'OR':
+                position += 1
+                continue
+            return '(' + ' OR '.join(clauses) + ')', args, position
+
+    def parseAnd(self, tokens, position):
+        clauses, args = [], []
+        while position < len(tokens) and tokens[position] not in ('OR', ')'):
+            where, termArgs, position = self.parseUnary(tokens, position)
+            clauses.append(where)
+            args += termArgs
+        return '(' + ' AND '.join(clauses or ['1']) + ')', args, position
+
+    def parseUnary(self, tokens, position):
+        token = tokens[position]
+        if token == '-':
+            where, args, position = self.parseUnary(tokens, position + 1)
+            return f'NOT {where}', args, position
+        if token == '(':
+            where, args, position = self.parseOr(tokens, position + 1)
+            return where, args, position + 1  # Past the closing parenthesis
+        where, args = self.searchTerm(token)
+        return where, args, position + 1
+
+    def searchTerm(self, token):
+        if token.startswith('-'):
+            where, args = self.searchTerm(token[1:])
+            return f'NOT {where}', args
+        key, value = token.strip('"').split(':', 1)
+        if key == 'deck' and value == '*':
+            return '1', []
+        if key == 'cid':
+            return f'c.id IN ({value})', []
+        if key == 'nid':
+            return f'n.id IN ({value})', []
+        if key == 'did':
+            return f'(c.did IN ({value}) OR c.odid IN ({value}))', []
+        if key == 'mid':
+            return 'n.mid = ?', [int(value)]
+        if key == 'is':
+            return {'new': 'c.type = 0', 'learn': 'c.queue IN (1, 3)', 'review': 'c.type IN (2, 3)'}[value], []
+        if key == 'tag':
+            if value == 'none':
+                return "n.tags = ''", []
+            # Case insensitive and matching child tags, like Anki
+            return "(' ' || lower(n.tags) || ' ' LIKE ? OR ' ' || lower(n.tags) LIKE ?)", [f'% {value.lower()} %', f'% {value.lower()}::%']
+        raise Exception(f'Unsupported search term: {token}')
+
+    def close(self):
+        self.db.connection.close()
+        os.remove(self.path)
+
+
+def buildCollection(cardCount, seed=0, path=None):
+    ''' A collection of about cardCount cards (one or two per note), with a few reviews per reviewed card. '''
+    rng = random.Random(seed)
+    if path is None:
+        handle, path = tempfile.mkstemp(suffix='.anki2')
+        os.close(handle)
+    connection = sqlite3.connect(path)
+    connection.executescript(schema)
+
+    decks = {}
+    for i, name in enumerate(deckNames + filteredDeckNames):
+        decks[i + 1] = {'id': i + 1, 'name': name, 'dyn': name in filteredDeckNames}
+    normalDids = [d['id'] for d in decks.values() if not d['dyn']]
+    filteredDids = [d['id'] for d in decks.values() if d['dyn']]
+    models = {}
+    for i, (name, fields) in enumerate(noteTypes.items()):
+        mid = 1000 + i
+        qfmt = f'{templateScript}<div class="{noteTypeLanguages[name]}">{{{{{fields[0]}}}}}</div>'
+        fieldDicts = [{'name': f, 'ord': o} for o, f in enumerate(fields)]
+        models[mid] = {'id': mid, 'name': name, 'flds': fieldDicts, 'sortf': 0, 'tmpls': [{'qfmt': qfmt}], 'css': noteTypeCss}
+    mids = list(models)
+    states = [(queue, cardType) for queue, cardType, chance in cardStates]
+    stateWeights = [chance for queue, cardType, chance in cardStates]
+
+    def fieldText():
+        pieces = [rng.choice(words) for _ in range(rng.randint(1, 12))]
+        if rng.random() < 0.3:
+            pieces.insert(0, rng.choice(markup))
+        return ''.join(pieces)
+
+    notes, cards, revlog = [], [], []
+    nid, cid, rid = 1_500_000_000_000, 1_600_000_000_000, 1_700_000_000_000
+    while len(cards) < cardCount:
+        nid += 1
+        mid = rng.choice(mids)
+        tags = ' '.join(rng.sample(tagNames, rng.randint(0, 4)))
+        notes.append((nid, mid, rng.randint(1_600_000_000, 1_700_000_000), f' {tags} ' if tags else '', '\x1f'.join(fieldText() for f in models[mid]['flds'])))
+        did = rng.choice(normalDids)
+        for ord in range(1 if rng.random() < 0.7 else 2):
+            cid += 1
+            queue, cardType = rng.choices(states, stateWeights)[0]
+            inFiltered = rng.random() < 0.02
+            reps = 0 if cardType == 0 else rng.randint(1, 8)
+            cards.append((cid, nid, rng.choice(filteredDids) if inFiltered else did, did if inFiltered else 0, ord, rng.randint(1_600_000_000, 1_700_000_000), cardType, queue, reps))
+            for _ in range(reps):
+                rid += 1
+                revlog.append((rid, cid, rng.choices((1, 2, 3, 4), (0.15, 0.1, 0.65, 0.1))[0]))
+
+    with connection:
+        connection.executemany('INSERT INTO notes VALUES (?, ?, ?, ?, ?)', notes)
+        connection.executemany('INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', cards)
+        connection.executemany('INSERT INTO revlog VALUES (?, ?, ?)', revlog)
+    connection.close()
+    return FakeCollection(path, decks, models, tagNames)
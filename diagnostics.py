@@ -0,0 +1,86 @@
+import functools
+import threading
+import time
+
+# Optional timing of the add-on's hot paths, shown in the Diagnostics tab. Instrumented functions only check a
+# flag when it's off, so leaving the decorators in place costs next to nothing.
+
+# Upper bounds of the latency histogram buckets, in microseconds. The last bucket holds everything slower.
+bucketBounds = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class ComponentStats():
+    def __init__(self):
+        self.calls = 0
+        self.totalTime = 0.0
+        self.maxTime = 0.0
+        self.buckets = [0] * (len(bucketBounds) + 1)
+
+    def record(self, seconds):
+        self.calls += 1
+        self.totalTime += seconds
+        self.maxTime = max(self.maxTime, seconds)
+        micros = seconds * 1e6
+        for i, bound in enumerate(bucketBounds):
+            if micros <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def asDict(self):
+        return {
+            'calls': self.calls,
+            'totalMs': self.totalTime * 1e3,
+            'meanUs': self.totalTime / self.calls * 1e6 if self.calls else 0,
+            'maxUs': self.maxTime * 1e6,
+            'histogramUs': {f'<={bound}': count for bound, count in zip(bucketBounds, self.buckets)} | {f'>{bucketBounds[-1]}': self.buckets[-1]},
+        }
+
+
+class Instrumentation():
+    ''' Call counts, cumulative time and a latency histogram per component, recorded only while enabled. '''
+
+    def __init__(self):
+        self.enabled = False
+        self.components = {}
+        self.lock = threading.Lock()  # The review lookahead records from a worker thread too
+
+    def record(self, component, seconds):
+        with self.lock:
+            if component not in self.components:
+                self.components[component] = ComponentStats()
+            self.components[component].record(seconds)
+
+    def reset(self):
+        with self.lock:
+            self.components = {}
+
+    def snapshot(self):
+        with self.lock:
+            return {name: stats.asDict() for name, stats in sorted(self.components.items())}
+
+
+instrumentation = Instrumentation()
+
+
+def timed(component):
+    '''
+    Decorator recording every call of the function under component while instrumentation is enabled. Calls off
+    the main thread (the review lookahead, preview searches) are recorded separately, so they don't blur the
+    numbers of the reviewer hook.
+    '''
+    backgroundComponent = f'{component} (background)'
+
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not instrumentation.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                onMainThread = threading.current_thread() is threading.main_thread()
+                instrumentation.record(component if onMainThread else backgroundComponent, time.perf_counter() - start)
+        return wrapper
+    return decorate
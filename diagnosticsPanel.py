@@ -0,0 +1,85 @@
+import json
+from aqt.qt import QWidget, QVBoxLayout, QHBoxLayout, QCheckBox, QPushButton, QLabel, QTableWidget, QTableWidgetItem, QFileDialog
+from .diagnostics import instrumentation
+from .utils import stripCache
+
+
+class DiagnosticsPanel(QWidget):
+    ''' Shows what the instrumentation recorded, so a slow card flip can be pinned on a finder or step. '''
+    headers = ('Component', 'Calls', 'Total ms', 'Mean us', 'Max us', 'Histogram (us: calls)')
+
+    def __init__(self, configRoot, runtime):
+        super().__init__()
+        self.config = configRoot.addBranch('diagnostics', {'enabled': False})
+        self.runtime = runtime
+        self.buildGUI()
+        self.readConfig()
+        self.refresh()
+
+    def buildGUI(self):
+        self.layout = QVBoxLayout(self)
+        self.enabledCheckBox = QCheckBox('Record timings (takes effect immediately, saved with Save)')
+        self.table = QTableWidget(0, len(self.headers))
+        self.table.setHorizontalHeaderLabels(self.headers)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.cacheLbl = QLabel()
+        self.refreshBtn = QPushButton('Refresh')
+        self.resetBtn = QPushButton('Reset')
+        self.exportBtn = QPushButton('Export JSON...')
+
+        self.enabledCheckBox.toggled.connect(self.enabledToggled)
+        self.refreshBtn.pressed.connect(self.refresh)
+        self.resetBtn.pressed.connect(self.resetPressed)
+        self.exportBtn.pressed.connect(self.exportPressed)
+
+        self.btnLayout = QHBoxLayout()
+        self.btnLayout.addWidget(self.refreshBtn)
+        self.btnLayout.addWidget(self.resetBtn)
+        self.btnLayout.addWidget(self.exportBtn)
+        self.layout.addWidget(self.enabledCheckBox)
+        self.layout.addWidget(self.table)
+        self.layout.addWidget(self.cacheLbl)
+        self.layout.addLayout(self.btnLayout)
+
+    def readConfig(self):
+        self.enabledCheckBox.setChecked(self.config.read('enabled'))
+
+    def writeConfig(self):
+        self.config.write('enabled', self.enabledCheckBox.isChecked())
+
+    def enabledToggled(self, checked):
+        instrumentation.enabled = checked
+
+    def report(self):
+        ''' Everything shown in the tab, as exported to JSON. '''
+        return {
+            'enabled': instrumentation.enabled,
+            'components': instrumentation.snapshot(),
+            'caches': {'matchCache': self.runtime.matchCache.stats(), 'stripCache': stripCache.stats()},
+        }
+
+    def refresh(self):
+        components = instrumentation.snapshot()
+        self.table.setRowCount(len(components))
+        for row, (name, stats) in enumerate(components.items()):
+            histogram = ' '.join(f'{bucket}: {count}' for bucket, count in stats['histogramUs'].items() if count)
+            values = (name, stats['calls'], f'{stats["totalMs"]:.1f}', f'{stats["meanUs"]:.0f}', f'{stats["maxUs"]:.0f}', histogram)
+            for column, value in enumerate(values):
+                self.table.setItem(row, column, QTableWidgetItem(str(value)))
+        self.table.resizeColumnsToContents()
+        caches = self.report()['caches']
+        self.cacheLbl.setText(' | '.join(
+            f'{name}: {stats["hits"]} hits, {stats["misses"]} misses, {stats["size"]}/{stats["maxSize"]} entries'
+            for name, stats in caches.items()
+        ))
+
+    def resetPressed(self):
+        instrumentation.reset()
+        self.refresh()
+
+    def exportPressed(self):
+        path, _ = QFileDialog.getSaveFileName(self, 'Export diagnostics', 'randomFontDiagnostics.json', 'JSON (*.json)')
+        if not path:
+            return
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
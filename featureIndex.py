@@ -0,0 +1,179 @@
+import re
+import sqlite3
+import threading
+from aqt import mw, gui_hooks
+from .diagnostics import timed
+from .patterns import compilePattern, requiredLiterals
+from .utils import stripTagsUncached, userFilePath
+
+kanjiPattern = re.compile('[一-龯]')
+sqlComparators = {'<': '<', '<=': '<=', '==': '=', '>=': '>=', '>': '>', '!=': '!='}
+schemaVersion = 1  # Bump to rebuild everyone's index when the tables change
+schema = '''
+    PRAGMA journal_mode = WAL;
+    PRAGMA synchronous = OFF;
+    CREATE TABLE IF NOT EXISTS features (
+        nid INTEGER NOT NULL,
+        mid INTEGER NOT NULL,
+        mod INTEGER NOT NULL,
+        ord INTEGER NOT NULL,
+        length INTEGER NOT NULL,
+        kanji INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        PRIMARY KEY (nid, ord)
+    );
+    CREATE INDEX IF NOT EXISTS featuresByField ON features (mid, ord, length, kanji);
+'''
+# Full text search over the stripped text. Needs the trigram tokenizer (SQLite 3.34+) so that any substring can
+# be looked up, not just whole words. Kept in sync with features by insertRows/deleteNotes rather than triggers,
+# since one bulk insert after a batch of rows is several times faster than one per row.
+textSearchSchema = '''
+    CREATE VIRTUAL TABLE fieldText USING fts5(text, content='features', tokenize='trigram');
+    INSERT INTO fieldText (fieldText) VALUES ('rebuild');
+'''
+
+
+def fieldFeatures(stripped):
+    ''' The length and number of kanji of a field's stripped text, as compared by the Field finder. '''
+    # NOTE Remove spaces. I don't feel they should be counted
+    return len(stripped.replace(' ', '')), len(kanjiPattern.findall(stripped))
+
+
+def textSearchQuery(pattern):
+    ''' An FTS5 query matching a superset of the texts the regex matches, or None if it can't narrow them. '''
+    # The trigram tokenizer can only look up substrings of at least three characters
+    phrases = ['"' + literal.replace('"', '""') + '"' for literal in requiredLiterals(pattern) if len(literal) >= 3]
+    return ' AND '.join(phrases) if phrases else None
+
+
+def regexpSearch(pattern, text):
+    return bool(compilePattern(pattern).search(text))
+
+
+class NoteFeatureIndex():
+    '''
+    Optional sidecar SQLite index of the stripped text, length and number of kanji of every field of every note,
+    kept in user_files (one file per profile). Rows are keyed by note id and note.mod, and only notes added or
+    changed since the last refresh are parsed again. The database is only a cache and can be deleted at any time.
+    '''
+    chunkSize = 1000
+
+    def __init__(self):
+        self.local = threading.local()  # sqlite3 connections can't be shared between threads
+
+    def register(self):
+        gui_hooks.collection_did_load.append(self.collectionLoaded)
+
+    def collectionLoaded(self, col):
+        self.local = threading.local()
+
+    def connection(self):
+        path = userFilePath(f'noteFeatures-{mw.pm.name}.sqlite')
+        if getattr(self.local, 'path', None) != path:
+            connection = sqlite3.connect(path)
+            if connection.execute('PRAGMA user_version').fetchone()[0] != schemaVersion:
+                connection.executescript('''
+                    DROP TABLE IF EXISTS fieldText;
+                    DROP TABLE IF EXISTS features;
+                ''')
+                connection.execute(f'PRAGMA user_version = {schemaVersion}')
+            connection.executescript(schema)
+            connection.create_function('regexp', 2, regexpSearch, deterministic=True)
+            self.local.textSearch = self.createTextSearch(connection)
+            self.local.connection = connection
+            self.local.path = path
+        return self.local.connection
+
+    def createTextSearch(self, connection):
+        ''' Returns whether full text search is available, creating its table the first time. '''
+        if connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'fieldText'").fetchone():
+            return True
+        try:
+            with connection:
+                connection.executescript(textSearchSchema)
+            return True
+        except sqlite3.OperationalError:  # No FTS5 or trigram tokenizer in this SQLite build
+            return False
+
+    @timed('NoteFeatureIndex.lookup')
+    def lookup(self, nid, mod, ord):
+        ''' (length, kanji, text) of a field, or None if the note isn't indexed at this mod time. '''
+        qry = 'SELECT length, kanji, text FROM features WHERE nid = ? AND ord = ? AND mod = ?'
+        return self.connection().execute(qry, (nid, ord, mod)).fetchone()
+
+    def featureRows(self, nid, mid, mod, fieldValues):
+        rows = []
+        for ord, value in enumerate(fieldValues):
+            stripped = stripTagsUncached(value)
+            rows.append((nid, mid, mod, ord, *fieldFeatures(stripped), stripped))
+        return rows
+
+    def store(self, nid, mid, mod, fieldValues):
+        ''' Index one note. Returns {ord: (length, kanji, text)} for its fields. '''
+        rows = self.featureRows(nid, mid, mod, fieldValues)
+        connection = self.connection()
+        with connection:
+            self.deleteNotes(connection, [nid])
+            self.insertRows(connection, rows)
+        return {row[3]: row[4:] for row in rows}
+
+    def deleteNotes(self, connection, nids):
+        nids = [(nid,) for nid in nids]
+        if self.local.textSearch:
+            qry = "INSERT INTO fieldText (fieldText, rowid, text) SELECT 'delete', rowid, text FROM features WHERE nid = ?"
+            connection.executemany(qry, nids)
+        connection.executemany('DELETE FROM features WHERE nid = ?', nids)
+
+    def insertRows(self, connection, rows):
+        lastRowid = connection.execute('SELECT coalesce(max(rowid), 0) FROM features').fetchone()[0]
+        connection.executemany('INSERT INTO features VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        if self.local.textSearch:
+            # New rows always get rowids above the current largest
+            connection.execute('INSERT INTO fieldText (rowid, text) SELECT rowid, text FROM features WHERE rowid > ?', (lastRowid,))
+
+    @timed('NoteFeatureIndex.refresh')
+    def refresh(self):
+        ''' Bring the index up to date with the collection, parsing only the notes that changed since last time. '''
+        connection = self.connection()
+        current = {nid: mod for nid, mod in mw.col.db.all('SELECT id, mod FROM notes')}
+        indexed = {nid: mod for nid, mod in connection.execute('SELECT nid, max(mod) FROM features GROUP BY nid')}
+        stale = [nid for nid, mod in current.items() if indexed.get(nid) != mod]
+        removed = [nid for nid in indexed if nid not in current]
+        with connection:
+            self.deleteNotes(connection, removed + [nid for nid in stale if nid in indexed])
+            for start in range(0, len(stale), self.chunkSize):
+                ids = ','.join(str(nid) for nid in stale[start:start + self.chunkSize])
+                rows = []
+                for nid, mid, mod, flds in mw.col.db.all(f'SELECT id, mid, mod, flds FROM notes WHERE id IN ({ids})'):
+                    rows += self.featureRows(nid, mid, mod, flds.split('\x1f'))
+                self.insertRows(connection, rows)
+
+    def matchingNids(self, fieldOrds, contentsPattern, lengthTest, kanjiTest):
+        '''
+        Ids of the notes whose field (the one at fieldOrds[mid] for their note type) is matched by the contents
+        regex and passes the length and kanji tests. Each test is (comparator, target), and it or the regex can be
+        None. The index should be refreshed first.
+        '''
+        if not fieldOrds:
+            return []
+        connection = self.connection()
+        clauses = ['(' + ' OR '.join('(mid = ? AND ord = ?)' for mid in fieldOrds) + ')']
+        args = [value for pair in fieldOrds.items() for value in pair]
+        for column, test in (('length', lengthTest), ('kanji', kanjiTest)):
+            if test:
+                comparator, target = test
+                clauses.append(f'{column} {sqlComparators[comparator]} ?')
+                args.append(target)
+        if contentsPattern is not None:
+            textQuery = textSearchQuery(contentsPattern) if self.local.textSearch else None
+            if textQuery:
+                # The trigram lookup narrows the rows down, then the regex itself only runs on what's left
+                clauses.append('rowid IN (SELECT rowid FROM fieldText WHERE fieldText MATCH ?)')
+                args.append(textQuery)
+            clauses.append('regexp(?, text)')
+            args.append(contentsPattern)
+        qry = 'SELECT nid FROM features WHERE ' + ' AND '.join(clauses)
+        return [nid for nid, in connection.execute(qry, args)]
+
+
+noteFeatureIndex = NoteFeatureIndex()
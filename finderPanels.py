@@ -1,13 +1,13 @@
-from aqt.qt import Qt, QWidget, QVBoxLayout, QScrollArea, QHBoxLayout, QPushButton, QCheckBox, QButtonGroup, QRadioButton
+from aqt.qt import Qt, QWidget, QVBoxLayout, QScrollArea, QHBoxLayout, QPushButton, QCheckBox, QButtonGroup, QRadioButton, QMessageBox, QSpinBox, QLineEdit, QLabel
 # from anki.hooks import wrap
-from aqt import mw, gui_hooks
-from aqt.utils import showText
 # from aqt.previewer import Previewer
 from .finderWidgets import DeckFinderWidget, NoteTypeFinderWidget, CardStateFinderWidget, TagFinderWidget, SuccessRateFinderWidget, PassFinderWidget, FieldFinderWidget
+from .finderRules import FinderPanelRule
+from .fontTable import writingSystems
+from .patterns import patternError
+from .previewDialog import PreviewDialog
 from .utils import MyGroupBox
 
-# NOTE CardLayout appears to pass 0 rather than the real card.id to card_will_show,
-#   so don't think we can edit text in cardlayout?
 # NOTE Should panels have unique config keys instead in case two fall under the same thing?
 # would mean you gotta update those keys if they change for whatever reason
 
@@ -21,54 +21,28 @@ def previewerAns(self, cmd: str):
 
 
 class DefaultFinderPanel(QWidget):
-    defaults = {
-        'logic': 0,
-        'negate': False,
-        # 'applyToPreviewer': True,
-    }
+    defaults = FinderPanelRule.defaults
 
-    def __init__(self, modifyQ, modifyA, configRoot, name):
+    def __init__(self, configRoot, name):
         super().__init__()
-        self.modifyQ = modifyQ
-        self.modifyA = modifyA
         self.config = configRoot.addBranch(name, self.defaults)
         self.widgetsConfig = self.config.addBranch('widgets')
         self.name = name
         self.finders = []
-        gui_hooks.card_will_show.append(self.checkCard)
         self.buildGUI()
         self.readConfig()
 
         # self.previewerToggled(self.previewerCheck.checkState().value)
 
-    def checkCard(self, text, card, kind):
-        if kind in ('clayoutQuestion', 'clayoutAnswer'):
-            return text
-        doesMatch = self.confirmMatch(card)
-        if not doesMatch:
-            return text
-        if kind in ('reviewQuestion', 'previewQuestion'):
-            return self.modifyQ(text)
-        elif kind in ('reviewAnswer', 'previewAnswer'):
-            return self.modifyA(text)
-
-    def confirmMatch(self, card):
-        matches = [f.checkMatch(card) for f in self.finders if f.isChecked()]
-        if not matches:  # Should mean that no finders are checked
-            doesMatch = False
-        elif self.logic() == 'or':
-            doesMatch = any(matches)
-        elif self.logic() == 'and':
-            doesMatch = all(matches)
-        else:
-            raise Exception('Invalid logic')
-
-        if self.negateCheckBox.isChecked():
-            doesMatch = not doesMatch
-        return doesMatch
-
-    def unhook(self):
-        gui_hooks.card_will_show.remove(self.checkCard)
+    def currentConfig(self):
+        ''' The panel's config as currently shown, including unsaved edits. '''
+        return {
+            'logic': self.logicButtonGroup.checkedId(),
+            'negate': self.negateCheckBox.isChecked(),
+            'priority': self.prioritySpin.value(),
+            'languages': self.selectedLanguages(),
+            'widgets': {f.ruleType.label: f.currentConfig() for f in self.finders},
+        }
 
     def buildGUI(self):
         # Holds the inner layout, after which other stuff can be added
@@ -117,6 +91,17 @@ class DefaultFinderPanel(QWidget):
         self.negateCheckBox = QCheckBox('Negate')
         self.logicGroupBoxOuter.layout.addWidget(self.negateCheckBox)
 
+        # When several panels match a card, the one with the highest priority decides which languages get random fonts
+        self.applyGroupBox = MyGroupBox('Apply', QHBoxLayout)
+        self.prioritySpin = QSpinBox()
+        self.prioritySpin.setRange(-99, 99)
+        self.languagesInput = QLineEdit()
+        self.languagesInput.setPlaceholderText('All languages (or e.g. Japanese,Korean)')
+        self.applyGroupBox.layout.addWidget(QLabel('Priority'))
+        self.applyGroupBox.layout.addWidget(self.prioritySpin)
+        self.applyGroupBox.layout.addWidget(QLabel('Languages'))
+        self.applyGroupBox.layout.addWidget(self.languagesInput)
+
         '''
         self.applyToGroupBox = MyGroupBox('Apply to', QHBoxLayout)
         self.reviewerCheck = QCheckBox('Reviewer')
@@ -132,6 +117,7 @@ class DefaultFinderPanel(QWidget):
         self.innerLayout = QVBoxLayout(self.innerWidget)
         # self.innerLayout.addWidget(self.applyToGroupBox)
         self.innerLayout.addWidget(self.logicGroupBoxOuter)
+        self.innerLayout.addWidget(self.applyGroupBox)
         for finder in self.finders:
             self.innerLayout.addWidget(finder)
         self.outerLayout.addWidget(self.scroll)
@@ -153,31 +139,46 @@ class DefaultFinderPanel(QWidget):
             Previewer._on_bridge_cmd = originalPreviewerBridgeCmd
     '''
 
+    def selectedLanguages(self):
+        return [language.strip() for language in self.languagesInput.text().split(',') if language.strip()]
+
     def logic(self):
         return self.logicButtonGroup.checkedButton().text()
 
+    def patternError(self):
+        ''' Why the search as currently shown can't be compiled (an invalid regex), or None if it can. '''
+        for finder in self.finders:
+            config = finder.currentConfig()
+            if not config['enabled']:
+                continue
+            for pattern in finder.ruleType.configPatterns(config):
+                error = patternError(pattern)
+                if error:
+                    return f'{finder.ruleType.label}: {error}'
+        return None
+
+    def languagesError(self):
+        ''' Which of the typed languages aren't ones Qt knows, or None. A card would match but get no random fonts. '''
+        unknown = [language for language in self.selectedLanguages() if language not in writingSystems]
+        if unknown:
+            return f'Unknown languages: {", ".join(unknown)} (use the names listed under Configure Fonts)'
+        return None
+
     def previewPressed(self):
-        allcids = mw.col.db.list('SELECT id FROM cards')
-        allcards = [mw.col.get_card(cid) for cid in allcids]
-        matchingCards = [card for card in allcards if self.confirmMatch(card)]
-        bigstr = f'{len(matchingCards)} results: \n\n'
-        for card in matchingCards:
-            did = card.odid if card.odid else card.did
-            deckName = mw.col.decks.get(did)['name']
-            note = card.note()
-            noteType = card.note_type()
-            sortField = note.items()[noteType['sortf']]
-
-            bigstr += f'Card: {card.id}\n'
-            bigstr += f'    Deck: {deckName}\n'
-            bigstr += f'    {sortField[0]}: {sortField[1]}\n'
-            bigstr += f'    NoteType:  {noteType["name"]}\n'
-            bigstr += f'    Tags: {note.tags}\n\n'
-        showText(bigstr)
+        error = self.patternError()
+        if error:
+            QMessageBox.warning(self, 'Invalid search', error)
+            return
+        # Preview what's currently in the panel, even if it hasn't been saved yet
+        self.previewDialog = PreviewDialog(FinderPanelRule.fromConfig(self.currentConfig()), self)
+        self.previewDialog.show()
+        self.previewDialog.start()
 
     def readConfig(self):
         self.logicButtonGroup.button(self.config.read('logic')).setChecked(True)
         self.negateCheckBox.setChecked(self.config.read('negate'))
+        self.prioritySpin.setValue(self.config.read('priority'))
+        self.languagesInput.setText(','.join(self.config.read('languages')))
         # previewerState = self.config.read('applyToPreviewer')
         # self.previewerCheck.setChecked(previewerState)
 
@@ -185,6 +186,8 @@ class DefaultFinderPanel(QWidget):
         self.config.writes((
             ('logic', self.logicButtonGroup.checkedId()),
             ('negate', self.negateCheckBox.isChecked()),
+            ('priority', self.prioritySpin.value()),
+            ('languages', self.selectedLanguages()),
             # ('applyToPreviewer', self.previewerCheck.isChecked()),
         ))
         for finder in self.finders:
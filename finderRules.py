@@ -0,0 +1,566 @@
+import json
+import operator
+from functools import cached_property
+from anki.collection import SearchNode
+from aqt import mw
+from .diagnostics import timed
+from .featureIndex import fieldFeatures, noteFeatureIndex
+from .patterns import compilePattern
+from .revlogIndex import passIndex
+from .utils import strip_tags
+
+# Rules are the compiled, read-only counterpart of the finder widgets. They are built straight from config
+# so that the card_will_show hook never has to touch (or even build) any Qt widgets.
+
+comparators = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '>=': operator.ge,
+    '>': operator.gt,
+    '!=': operator.ne,
+}
+logicOptions = ('or', 'and')  # Indexed by the id of the checked logic radio button
+allCardsSearch = 'deck:*'
+noCardsSearch = 'cid:0'
+cardStateSearches = {0: 'is:new', 1: 'is:learn', 2: 'is:review', 3: 'is:learn'}  # Queue -> closest Anki search
+
+
+def anyOf(searches):
+    ''' OR together Anki searches. An empty list matches nothing. '''
+    searches = list(searches)
+    if not searches:
+        return noCardsSearch
+    return '(' + ' OR '.join(searches) + ')'
+
+
+def allOf(searches):
+    return '(' + ' '.join(searches) + ')'
+
+
+class CardContext():
+    '''
+    Everything the rules might want to know about one card, loaded on first use and then shared by every rule
+    evaluated against it. A card's note is never loaded more than once per evaluation.
+    '''
+
+    def __init__(self, card):
+        self.card = card
+        self.strippedFields = {}
+        self.ruleResults = {}  # Rules shared between panels are only checked once per card
+
+    def checkRule(self, rule):
+        if rule not in self.ruleResults:
+            self.ruleResults[rule] = rule.checkMatch(self)
+        return self.ruleResults[rule]
+
+    @cached_property
+    def note(self):
+        return self.card.note()
+
+    @cached_property
+    def mid(self):
+        if 'note' in self.__dict__:  # Already loaded by another rule
+            return self.note.mid
+        return mw.col.db.scalar('SELECT mid FROM notes WHERE id = ?', self.card.nid)
+
+    @cached_property
+    def midAndMod(self):
+        if 'note' in self.__dict__:
+            return self.note.mid, self.note.mod
+        return tuple(mw.col.db.first('SELECT mid, mod FROM notes WHERE id = ?', self.card.nid))
+
+    @cached_property
+    def noteType(self):
+        # Same as card.note_type(), but reusing the note that's already loaded
+        return mw.col.models.get(self.note.mid)
+
+    @cached_property
+    def deckName(self):
+        did = self.card.odid if self.card.odid else self.card.did
+        return mw.col.decks.get(did)['name']
+
+    @cached_property
+    def tags(self):
+        return self.note.tags
+
+    @cached_property
+    def fields(self):
+        return self.note.items()
+
+    def strippedField(self, fieldName, fieldValue):
+        if fieldName not in self.strippedFields:
+            self.strippedFields[fieldName] = strip_tags(fieldValue)
+        return self.strippedFields[fieldName]
+
+    @cached_property
+    def passes(self):
+        return passIndex.get(self.card.id)
+
+
+class MetaFinderRule():
+    # Rough relative cost of checkMatch. Cheaper rules are evaluated first so that expensive ones can be skipped.
+    cost = 0
+
+    def __init__(self, config):
+        raise Exception('Not Implemented')
+
+    def checkMatch(self, context):
+        ''' context is the CardContext of the card being checked. '''
+        raise Exception('Not Implemented')
+
+    def nativeSearch(self):
+        '''
+        Returns (search, exact): an Anki search matching at least every card this rule matches, and whether it
+        matches exactly those cards. Returns None if the rule can't be expressed as an Anki search.
+        '''
+        return None
+
+    def invalidate(self):
+        ''' Forget anything worked out from the collection (deck names, tags, ...), since it changed. '''
+        pass
+
+    @staticmethod
+    def configPatterns(config):
+        ''' The user-typed patterns __init__ would compile from this config, so they can be checked before saving. '''
+        return ()
+
+
+class FieldFinderRule(MetaFinderRule):
+    cost = 4  # Loads the note and parses field HTML
+    label = 'Field'
+    defaults = {
+        'enabled': False,
+        'contentsEnabled': False,
+        'lengthEnabled': False,
+        'kanjiEnabled': False,
+        'nameText': '',
+        'contentsText': '',
+        'lengthComparator': '==',
+        'lengthValue': 0,
+        'kanjiComparator': '==',
+        'kanjiValue': 0,
+        'useIndex': False,
+    }
+
+    @staticmethod
+    def configPatterns(config):
+        return [config['nameText']] + ([config['contentsText']] if config['contentsEnabled'] else [])
+
+    def __init__(self, config):
+        self.namePattern = compilePattern(config['nameText']) if config['nameText'] else None
+        self.contentsPattern = compilePattern(config['contentsText']) if config['contentsEnabled'] else None
+        # Tests are (comparator, target), with the comparator kept as a string so it can also go into SQL
+        self.lengthTest = (config['lengthComparator'], config['lengthValue']) if config['lengthEnabled'] else None
+        self.kanjiTest = (config['kanjiComparator'], config['kanjiValue']) if config['kanjiEnabled'] else None
+        self.useIndex = config['useIndex']
+        self.fieldOrds = None
+
+    def matchingFieldOrds(self):
+        ''' mid -> ord of the first field whose name matches, for every note type with one. '''
+        # Built in a local and published in one step, since the review lookahead's worker thread shares this rule
+        fieldOrds = self.fieldOrds
+        if fieldOrds is None:
+            fieldOrds = {}
+            for m in mw.col.models.all():
+                for f in m['flds']:
+                    if self.namePattern.search(f['name']):
+                        fieldOrds[m['id']] = f['ord']
+                        break
+            self.fieldOrds = fieldOrds
+        return fieldOrds
+
+    def invalidate(self):
+        self.fieldOrds = None
+
+    def featuresMatch(self, length, kanji):
+        for test, value in ((self.lengthTest, length), (self.kanjiTest, kanji)):
+            if test and not comparators[test[0]](value, test[1]):
+                return False
+        return True
+
+    @timed('FieldFinderRule.checkMatch')
+    def checkMatch(self, context):
+        if not self.namePattern:
+            return False
+        if self.useIndex:
+            return self.checkIndexed(context)
+
+        for fieldName, fieldValue in context.fields:
+            if self.namePattern.search(fieldName):
+                fieldValue = context.strippedField(fieldName, fieldValue)
+                if self.contentsPattern and not self.contentsPattern.search(fieldValue):
+                    return False
+                if self.lengthTest or self.kanjiTest:
+                    return self.featuresMatch(*fieldFeatures(fieldValue))
+                return True
+        return False
+
+    def checkIndexed(self, context):
+        ''' checkMatch reading from the feature index. A note missing from it (or changed since) is indexed now. '''
+        mid, mod = context.midAndMod
+        ord = self.matchingFieldOrds().get(mid)
+        if ord is None:
+            return False
+        features = noteFeatureIndex.lookup(context.card.nid, mod, ord)
+        if features is None:
+            fieldValues = [value for name, value in context.fields]
+            features = noteFeatureIndex.store(context.card.nid, mid, mod, fieldValues)[ord]
+        length, kanji, text = features
+        if self.contentsPattern and not self.contentsPattern.search(text):
+            return False
+        return self.featuresMatch(length, kanji)
+
+    def nativeSearch(self):
+        if not self.namePattern:
+            return noCardsSearch, True
+        if self.useIndex:
+            # Everything is answered by the index (a range query, narrowed by full text search for a contents
+            # regex), so no field HTML is parsed except for notes changed since the last refresh
+            noteFeatureIndex.refresh()
+            contents = self.contentsPattern.pattern if self.contentsPattern else None
+            nids = noteFeatureIndex.matchingNids(self.matchingFieldOrds(), contents, self.lengthTest, self.kanjiTest)
+            return (f'nid:{",".join(map(str, nids))}' if nids else noCardsSearch), True
+        # Only the note types that have a matching field can match. The field contents still need checking in Python.
+        mids = [m['id'] for m in mw.col.models.all() if any(self.namePattern.search(f['name']) for f in m['flds'])]
+        return anyOf(f'mid:{mid}' for mid in mids), False
+
+
+class DeckFinderRule(MetaFinderRule):
+    cost = 1  # Set lookup of the card's deck id
+    label = 'Deck Name (regex)'
+    defaults = {
+        'enabled': False,
+        'text': ''
+    }
+
+    @staticmethod
+    def configPatterns(config):
+        return [config['text']]
+
+    def __init__(self, config):
+        self.pattern = compilePattern(config['text']) if config['text'] else None
+        self.dids = None
+
+    def matchingDeckIds(self):
+        # A card's own deck is never a filtered deck once odid is taken into account, so they can be left out
+        dids = self.dids
+        if dids is None:
+            decks = mw.col.decks.all_names_and_ids(include_filtered=False)
+            dids = self.dids = frozenset(d.id for d in decks if self.pattern.search(d.name))
+        return dids
+
+    def invalidate(self):
+        self.dids = None
+
+    @timed('DeckFinderRule.checkMatch')
+    def checkMatch(self, context):
+        if not self.pattern:
+            return False
+        card = context.card
+        return (card.odid if card.odid else card.did) in self.matchingDeckIds()
+
+    def nativeSearch(self):
+        if not self.pattern:
+            return noCardsSearch, True
+        # Anki's did: also matches a card's original deck, which is exact since filtered decks are left out
+        return anyOf(f'did:{did}' for did in sorted(self.matchingDeckIds())), True
+
+
+class NoteTypeFinderRule(MetaFinderRule):
+    cost = 2  # Set lookup of the note type id, which may need a query
+    label = 'Note Type (regex)'
+    defaults = {
+        'enabled': False,
+        'text': ''
+    }
+
+    @staticmethod
+    def configPatterns(config):
+        return [config['text']]
+
+    def __init__(self, config):
+        self.pattern = compilePattern(config['text']) if config['text'] else None
+        self.mids = None
+
+    def matchingNoteTypeIds(self):
+        mids = self.mids
+        if mids is None:
+            noteTypes = mw.col.models.all_names_and_ids()
+            mids = self.mids = frozenset(m.id for m in noteTypes if self.pattern.search(m.name))
+        return mids
+
+    def invalidate(self):
+        self.mids = None
+
+    @timed('NoteTypeFinderRule.checkMatch')
+    def checkMatch(self, context):
+        if not self.pattern:
+            return False
+        return context.mid in self.matchingNoteTypeIds()
+
+    def nativeSearch(self):
+        if not self.pattern:
+            return noCardsSearch, True
+        return anyOf(f'mid:{mid}' for mid in sorted(self.matchingNoteTypeIds())), True
+
+
+class TagFinderRule(MetaFinderRule):
+    cost = 3  # Loads the note for its tags
+    label = 'Tags (regex)'
+    defaults = {
+        'enabled': False,
+        'text': '',
+        'logic': 0
+    }
+
+    @staticmethod
+    def configPatterns(config):
+        return config['text'].split(' ')
+
+    def __init__(self, config):
+        self.patterns = tuple(compilePattern(p) for p in config['text'].split(' '))
+        self.logic = logicOptions[config['logic']]
+        self.invalidate()
+
+    def invalidate(self):
+        self.resolvedTags = None
+
+    def resolveTags(self):
+        '''
+        (allTags, tagSets, anyTags): the collection's tags, those matched by each pattern, and their union. Kept
+        in a single attribute so the lookahead's worker thread never sees some of them without the others.
+        '''
+        resolvedTags = self.resolvedTags
+        if resolvedTags is None:
+            allTags = frozenset(mw.col.tags.all())
+            tagSets = tuple(frozenset(t for t in allTags if p.search(t)) for p in self.patterns)
+            resolvedTags = self.resolvedTags = (allTags, tagSets, frozenset().union(*tagSets))
+        return resolvedTags
+
+    @timed('TagFinderRule.checkMatch')
+    def checkMatch(self, context):
+        allTags, tagSets, anyTags = self.resolveTags()
+        cardTags = context.tags
+        # Tags the registry doesn't know about yet (it's refreshed when tags change) are matched the slow way
+        unknownTags = [t for t in cardTags if t not in allTags]
+        if self.logic == 'or':
+            return not anyTags.isdisjoint(cardTags) or any(p.search(t) for p in self.patterns for t in unknownTags)
+        elif self.logic == 'and':
+            return all(
+                not tagSet.isdisjoint(cardTags) or any(p.search(t) for t in unknownTags)
+                for p, tagSet in zip(self.patterns, tagSets)
+            )
+        else:
+            raise Exception('invalid logic')
+
+    def nativeSearch(self):
+        # Inexact, since Anki's tag: search is case insensitive and also matches child tags
+        allTags, tagSets, anyTags = self.resolveTags()
+        searches = []
+        for tags in tagSets:
+            if len(tags) == len(allTags):
+                searches.append('-tag:none')
+            else:
+                searches.append(anyOf(mw.col.build_search_string(SearchNode(tag=t)) for t in sorted(tags)))
+        if self.logic == 'or':
+            return anyOf(searches), False
+        return allOf(searches), False
+
+
+class CardStateFinderRule(MetaFinderRule):
+    cost = 1  # Reads an attribute already on the card
+    label = 'Card States'
+    defaults = {
+        'enabled': False,
+        'options': []
+    }
+
+    def __init__(self, config):
+        self.options = frozenset(config['options'])
+
+    @timed('CardStateFinderRule.checkMatch')
+    def checkMatch(self, context):
+        return context.card.queue in self.options
+
+    def nativeSearch(self):
+        # Anki searches by card type rather than queue, which is looser
+        return anyOf(sorted({cardStateSearches[o] for o in self.options})), False
+
+
+class SuccessRateFinderRule(MetaFinderRule):
+    cost = 2  # Pass index lookup, built once per collection
+    label = 'Success Rate'
+    defaults = {
+        'enabled': False,
+        'comparator': '==',
+        'value': 0
+    }
+
+    def __init__(self, config):
+        self.comparator = comparators[config['comparator']]
+        self.target = config['value'] / 100
+
+    @timed('SuccessRateFinderRule.checkMatch')
+    def checkMatch(self, context):
+        if context.card.reps == 0:
+            successRate = 100  # TODO Should this be 100 or 0?
+        else:
+            successRate = context.passes / context.card.reps
+        return self.comparator(successRate, self.target)
+
+
+class PassFinderRule(MetaFinderRule):
+    cost = 2  # Pass index lookup, built once per collection
+    label = '# of Passes'
+    defaults = {
+        'enabled': False,
+        'comparator': '==',
+        'value': 0
+    }
+
+    def __init__(self, config):
+        self.comparator = comparators[config['comparator']]
+        self.target = config['value']
+
+    @timed('PassFinderRule.checkMatch')
+    def checkMatch(self, context):
+        return self.comparator(context.passes, self.target)
+
+
+class FinderPanelRule():
+    '''
+    The compiled search of a whole finder panel: its enabled finder rules plus logic and negation, and what
+    happens to the cards it matches (its priority among panels and the languages it randomises).
+    '''
+    defaults = {
+        'logic': 0,
+        'negate': False,
+        'priority': 0,
+        'languages': [],  # Empty for every language
+        # 'applyToPreviewer': True,
+    }
+    finderRuleTypes = (
+        DeckFinderRule,
+        NoteTypeFinderRule,
+        CardStateFinderRule,
+        TagFinderRule,
+        SuccessRateFinderRule,
+        PassFinderRule,
+        FieldFinderRule,
+    )
+
+    def __init__(self, logic, negate, finderRules, name='', priority=0, languages=()):
+        self.logic = logic
+        self.negate = negate
+        self.finderRules = tuple(sorted(finderRules, key=lambda r: r.cost))
+        self.name = name
+        self.priority = priority
+        self.languages = frozenset(languages)
+
+    @classmethod
+    def fromConfig(cls, config, name='', sharedRules=None):
+        '''
+        Compile a panel's config, either as saved or as currently shown in the search panel. Rules already in
+        sharedRules (keyed by type and config) are reused rather than compiled again, and new ones are added to it.
+        '''
+        config = cls.defaults | config
+        widgetsConfig = config.get('widgets', {})
+        sharedRules = {} if sharedRules is None else sharedRules
+        finderRules = []
+        for ruleType in cls.finderRuleTypes:
+            ruleConfig = ruleType.defaults | widgetsConfig.get(ruleType.label, {})
+            if ruleConfig['enabled']:
+                key = (ruleType, json.dumps(ruleConfig, sort_keys=True))
+                if key not in sharedRules:
+                    sharedRules[key] = ruleType(ruleConfig)
+                finderRules.append(sharedRules[key])
+        return cls(logicOptions[config['logic']], config['negate'], finderRules, name, config['priority'], config['languages'])
+
+    def filterLanguages(self, languages):
+        ''' The languages (of those a card uses) this panel gives random fonts to. '''
+        if not self.languages:
+            return languages
+        return [language for language in languages if language in self.languages]
+
+    def invalidate(self):
+        for rule in self.finderRules:
+            rule.invalidate()
+
+    @timed('confirmMatch')
+    def confirmMatch(self, card):
+        return self.matchContext(CardContext(card))
+
+    def matchContext(self, context):
+        # Lazily evaluated so any/all stop at the first rule that decides the result
+        matches = (context.checkRule(r) for r in self.finderRules)
+        if not self.finderRules:  # Should mean that no finders are enabled
+            doesMatch = False
+        elif self.logic == 'or':
+            doesMatch = any(matches)
+        elif self.logic == 'and':
+            doesMatch = all(matches)
+        else:
+            raise Exception('Invalid logic')
+
+        if self.negate:
+            doesMatch = not doesMatch
+        return doesMatch
+
+    def prefilter(self):
+        '''
+        Split this rule into an Anki search, which the backend can evaluate quickly, and a residual rule that must
+        still be run in Python on the search results. The residual rule is None if the search is exact.
+        '''
+        if not self.finderRules:
+            return (allCardsSearch if self.negate else noCardsSearch), None
+
+        searches = [r.nativeSearch() for r in self.finderRules]
+        if self.logic == 'and':
+            translated = [s for s in searches if s]
+            search = allOf(s for s, exact in translated) if translated else allCardsSearch
+            residual = [r for r, s in zip(self.finderRules, searches) if not (s and s[1])]
+        elif all(searches):
+            search = anyOf(s for s, exact in searches)
+            # Any card in the union may match through an inexact search, so every rule has to be checked again
+            residual = [] if all(exact for s, exact in searches) else self.finderRules
+        else:  # An untranslatable rule in an 'or' can match anything
+            search, residual = allCardsSearch, self.finderRules
+
+        if not residual:
+            return (f'-{search}' if self.negate else search), None
+        if self.negate:  # The complement of a superset isn't a superset
+            return allCardsSearch, self
+        return search, FinderPanelRule(self.logic, False, residual)
+
+
+class FinderDispatcher():
+    '''
+    Every finder panel, checked against a card in priority order (highest first, then config order) until one
+    matches. A panel limited to languages the card doesn't use is passed over, since it would give the card no
+    random fonts. All panels share one CardContext, so a deck, tag or revlog lookup is done at most once per
+    card, and identical finder rules in several panels are compiled once and checked once.
+    '''
+
+    def __init__(self, panels):
+        self.panels = tuple(sorted(panels, key=lambda p: -p.priority))
+
+    @classmethod
+    def fromConfig(cls, panelsConfig):
+        sharedRules = {}
+        return cls(FinderPanelRule.fromConfig(config, name, sharedRules) for name, config in panelsConfig.items())
+
+    def invalidate(self):
+        for panel in self.panels:
+            panel.invalidate()
+
+    @timed('matchingPanel')
+    def matchingPanel(self, card, languages):
+        ''' The highest priority panel matching the card and giving fonts to one of its languages, or None. '''
+        context = CardContext(card)
+        for panel in self.panels:
+            if panel.languages and panel.languages.isdisjoint(languages):
+                continue
+            if panel.matchContext(context):
+                return panel
+        return None
@@ -1,7 +1,6 @@
-from aqt import mw
 from aqt.qt import QVBoxLayout, QHBoxLayout, QGridLayout, QComboBox, QSpinBox, QCheckBox, QButtonGroup, QRadioButton, QLineEdit
-from .utils import CollapsibleGroupBox, strip_tags, MyGroupBox
-import re
+from .utils import CollapsibleGroupBox, MyGroupBox
+from .finderRules import FieldFinderRule, DeckFinderRule, NoteTypeFinderRule, TagFinderRule, CardStateFinderRule, SuccessRateFinderRule, PassFinderRule
 
 # TODO Only strip_tags if contents or length is checked
 
@@ -11,57 +10,22 @@ import re
 
 class MetaFinderWidget(CollapsibleGroupBox):
     def __init__(self, configRoot):
-        super().__init__(self.label, self.layoutType)
-        self.config = configRoot.addBranch(self.label, self.defaults)
+        super().__init__(self.ruleType.label, self.layoutType)
+        self.config = configRoot.addBranch(self.ruleType.label, self.ruleType.defaults)
         self.buildGUI()
         self.readConfig()
 
-    def checkMatch(self, cid):
+    def currentConfig(self):
+        ''' The config as currently shown in the GUI, which may not have been saved yet. '''
         raise Exception('Not Implemented')
 
+    def writeConfig(self):
+        self.config.writes(self.currentConfig().items())
+
 
 class FieldFinderWidget(MetaFinderWidget):
-    label = 'Field'
+    ruleType = FieldFinderRule
     layoutType = QVBoxLayout
-    defaults = {
-        'enabled': False,
-        'contentsEnabled': False,
-        'lengthEnabled': False,
-        'kanjiEnabled': False,
-        'nameText': '',
-        'contentsText': '',
-        'lengthComparator': '==',
-        'lengthValue': 0,
-        'kanjiComparator': '==',
-        'kanjiValue': 0,
-    }
-
-    def checkMatch(self, card):
-        fieldNamePattern = self.fieldNameInput.text()
-        if not fieldNamePattern:
-            return False
-
-        for fieldName, fieldValue in card.note().items():
-            if re.search(fieldNamePattern, fieldName):
-                fieldValue = strip_tags(fieldValue)
-                if self.contentsGroupBox.isChecked():
-                    if not re.search(self.contentsInput.text(), fieldValue):
-                        return False
-                if self.lengthGroupBox.isChecked():
-                    # NOTE Remove spaces. I don't feel they should be counted
-                    fieldLen = len(fieldValue.replace(' ', ''))
-                    comparator = self.lengthComparators.currentText()
-                    target = self.lengthSpin.value()
-                    if not eval(f'{fieldLen} {comparator} {target}'):
-                        return False
-                if self.kanjiGroupBox.isChecked():
-                    comparator = self.kanjiComparators.currentText()
-                    target = self.kanjiSpin.value()
-                    kanjiNum = len(re.findall('[一-龯]', fieldValue))
-                    if not eval(f'{kanjiNum} {comparator} {target}'):
-                        return False
-                return True
-        return False
 
     def buildGUI(self):
         self.fieldNameGroupBox = MyGroupBox('Field Name (regex)', QHBoxLayout)
@@ -89,10 +53,13 @@ class FieldFinderWidget(MetaFinderWidget):
         self.kanjiGroupBox.layout.addWidget(self.kanjiComparators, 0, 0, 1, 1)
         self.kanjiGroupBox.layout.addWidget(self.kanjiSpin, 0, 1, 1, 3)
 
+        self.indexCheckBox = QCheckBox('Use note feature index (faster field searches on large collections)')
+
         self.layout.addWidget(self.fieldNameGroupBox)
         self.layout.addWidget(self.contentsGroupBox)
         self.layout.addWidget(self.lengthGroupBox)
         self.layout.addWidget(self.kanjiGroupBox)
+        self.layout.addWidget(self.indexCheckBox)
 
     def readConfig(self):
         self.setChecked(self.config.read('enabled'))
@@ -105,37 +72,27 @@ class FieldFinderWidget(MetaFinderWidget):
         self.lengthSpin.setValue(self.config.read('lengthValue'))
         self.kanjiComparators.setCurrentText(self.config.read('kanjiComparator'))
         self.kanjiSpin.setValue(self.config.read('kanjiValue'))
-
-    def writeConfig(self):
-        self.config.writes((
-            ('enabled', self.isChecked()),
-            ('contentsEnabled', self.contentsGroupBox.isChecked()),
-            ('lengthEnabled', self.lengthGroupBox.isChecked()),
-            ('kanjiEnabled', self.kanjiGroupBox.isChecked()),
-            ('nameText', self.fieldNameInput.text()),
-            ('contentsText', self.contentsInput.text()),
-            ('lengthComparator', self.lengthComparators.currentText()),
-            ('lengthValue', self.lengthSpin.value()),
-            ('kanjiComparator', self.kanjiComparators.currentText()),
-            ('kanjiValue', self.kanjiSpin.value()),
-        ))
+        self.indexCheckBox.setChecked(self.config.read('useIndex'))
+
+    def currentConfig(self):
+        return {
+            'enabled': self.isChecked(),
+            'contentsEnabled': self.contentsGroupBox.isChecked(),
+            'lengthEnabled': self.lengthGroupBox.isChecked(),
+            'kanjiEnabled': self.kanjiGroupBox.isChecked(),
+            'nameText': self.fieldNameInput.text(),
+            'contentsText': self.contentsInput.text(),
+            'lengthComparator': self.lengthComparators.currentText(),
+            'lengthValue': self.lengthSpin.value(),
+            'kanjiComparator': self.kanjiComparators.currentText(),
+            'kanjiValue': self.kanjiSpin.value(),
+            'useIndex': self.indexCheckBox.isChecked(),
+        }
 
 
 class DeckFinderWidget(MetaFinderWidget):
-    label = 'Deck Name (regex)'
+    ruleType = DeckFinderRule
     layoutType = QHBoxLayout
-    defaults = {
-        'enabled': False,
-        'text': ''
-    }
-
-    def checkMatch(self, card):
-        pattern = self.input.text()
-        if not pattern:
-            return False
-        did = card.odid if card.odid else card.did
-        deckName = mw.col.decks.get(did)['name']
-        return bool(re.search(pattern, deckName))
 
     def buildGUI(self):
         self.input = QLineEdit()
@@ -146,26 +103,16 @@ class DeckFinderWidget(MetaFinderWidget):
         self.setChecked(self.config.read('enabled'))
         self.input.setText(self.config.read('text'))
 
-    def writeConfig(self):
-        self.config.writes((
-            ('enabled', self.isChecked()),
-            ('text', self.input.text()),
-        ))
+    def currentConfig(self):
+        return {
+            'enabled': self.isChecked(),
+            'text': self.input.text(),
+        }
 
 
 class NoteTypeFinderWidget(MetaFinderWidget):
-    label = 'Note Type (regex)'
+    ruleType = NoteTypeFinderRule
     layoutType = QHBoxLayout
-    defaults = {
-        'enabled': False,
-        'text': ''
-    }
-
-    def checkMatch(self, card):
-        pattern = self.input.text()
-        if not pattern:
-            return False
-        return bool(re.search(pattern, card.note_type()['name']))
 
     def buildGUI(self):
         self.input = QLineEdit()
@@ -176,40 +123,17 @@ class NoteTypeFinderWidget(MetaFinderWidget):
         self.setChecked(self.config.read('enabled'))
         self.input.setText(self.config.read('text'))
 
-    def writeConfig(self):
-        self.config.writes((
-            ('enabled', self.isChecked()),
-            ('text', self.input.text()),
-        ))
+    def currentConfig(self):
+        return {
+            'enabled': self.isChecked(),
+            'text': self.input.text(),
+        }
 
 
 class TagFinderWidget(MetaFinderWidget):
-    label = 'Tags (regex)'
-    defaults = {
-        'enabled': False,
-        'text': '',
-        'logic': 0
-    }
+    ruleType = TagFinderRule
     layoutType = QHBoxLayout
 
-    def checkMatch(self, card):
-        cardTags = card.note().tags
-        tagMatches = []
-        for tagPattern in self.input.text().split(' '):
-            tagMatch = False
-            for cardTag in cardTags:
-                if re.search(tagPattern, cardTag):
-                    tagMatch = True
-                    break
-            tagMatches.append(tagMatch)
-        logic = self.logicButtonGroup.checkedButton().text()
-        if logic == 'or':
-            return any(tagMatches)
-        elif logic == 'and':
-            return all(tagMatches)
-        else:
-            raise Exception('invalid logic')
-
     def buildGUI(self):
         self.input = QLineEdit()
         self.input.setPlaceholderText('Space-separated REGEX')
@@ -231,21 +155,17 @@ class TagFinderWidget(MetaFinderWidget):
         self.input.setText(self.config.read('text'))
         self.logicButtonGroup.button(self.config.read('logic')).setChecked(True)
 
-    def writeConfig(self):
-        self.config.writes((
-            ('enabled', self.isChecked()),
-            ('text', self.input.text()),
-            ('logic', self.logicButtonGroup.checkedId()),
-        ))
+    def currentConfig(self):
+        return {
+            'enabled': self.isChecked(),
+            'text': self.input.text(),
+            'logic': self.logicButtonGroup.checkedId(),
+        }
 
 
 class CardStateFinderWidget(MetaFinderWidget):
-    label = 'Card States'
+    ruleType = CardStateFinderRule
     layoutType = QHBoxLayout
-    defaults = {
-        'enabled': False,
-        'options': []
-    }
     cardStates = [
         ('New', 0),
         ('Learning', 1),
@@ -253,9 +173,6 @@ class CardStateFinderWidget(MetaFinderWidget):
         ('Relearning', 3)
     ]
 
-    def checkMatch(self, card):
-        return card.queue in self.selectedOptions()
-
     def buildGUI(self):
         self.optionBoxes = QButtonGroup()
         self.optionBoxes.setExclusive(False)
@@ -272,21 +189,16 @@ class CardStateFinderWidget(MetaFinderWidget):
         for option in self.config.read('options'):
             self.optionBoxes.button(option).setChecked(True)
 
-    def writeConfig(self):
-        self.config.writes((
-            ('enabled', self.isChecked()),
-            ('options', self.selectedOptions()),
-        ))
+    def currentConfig(self):
+        return {
+            'enabled': self.isChecked(),
+            'options': self.selectedOptions(),
+        }
 
 
 class SuccessRateFinderWidget(MetaFinderWidget):
-    label = 'Success Rate'
+    ruleType = SuccessRateFinderRule
     layoutType = QGridLayout
-    defaults = {
-        'enabled': False,
-        'comparator': '==',
-        'value': 0
-    }
 
     def buildGUI(self):
         self.comparators = QComboBox()
@@ -298,38 +210,22 @@ class SuccessRateFinderWidget(MetaFinderWidget):
         self.spinBox.setSuffix('%')
         self.layout.addWidget(self.spinBox, 0, 1, 1, 3)
 
-    def checkMatch(self, card):
-        if card.reps == 0:
-            successRate = 100  # TODO Should this be 100 or 0?
-        else:
-            qry = f'SELECT count(*) FROM revlog WHERE cid = {card.id} AND ease > 1'
-            passes = int(mw.col.db.first(qry)[0])
-            successRate = passes / card.reps
-        comparator = self.comparators.currentText()
-        target = self.spinBox.value() / 100
-        return eval(f'{successRate} {comparator} {target}')
-
     def readConfig(self):
         self.setChecked(self.config.read('enabled'))
         self.comparators.setCurrentText(self.config.read('comparator'))
         self.spinBox.setValue(self.config.read('value'))
 
-    def writeConfig(self):
-        self.config.writes((
-            ('enabled', self.isChecked()),
-            ('comparator', self.comparators.currentText()),
-            ('value', self.spinBox.value()),
-        ))
+    def currentConfig(self):
+        return {
+            'enabled': self.isChecked(),
+            'comparator': self.comparators.currentText(),
+            'value': self.spinBox.value(),
+        }
 
 
 class PassFinderWidget(MetaFinderWidget):
-    label = '# of Passes'
+    ruleType = PassFinderRule
     layoutType = QGridLayout
-    defaults = {
-        'enabled': False,
-        'comparator': '==',
-        'value': 0
-    }
 
     def buildGUI(self):
         self.comparators = QComboBox()
@@ -341,21 +237,15 @@ class PassFinderWidget(MetaFinderWidget):
         self.layout.addWidget(self.comparators, 0, 0, 1, 1)
         self.layout.addWidget(self.spinBox, 0, 1, 1, 3)
 
-    def checkMatch(self, card):
-        qry = f'SELECT count(*) FROM revlog WHERE cid = {card.id} AND ease > 1'
-        passes = int(mw.col.db.first(qry)[0])
-        comparator = self.comparators.currentText()
-        target = self.spinBox.value()
-        return eval(f'{passes} {comparator} {target}')
-
     def readConfig(self):
         self.setChecked(self.config.read('enabled'))
         self.comparators.setCurrentText(self.config.read('comparator'))
         self.spinBox.setValue(self.config.read('value'))
 
-    def writeConfig(self):
-        self.config.writes((
-            ('enabled', self.isChecked()),
-            ('comparator', self.comparators.currentText()),
-            ('value', self.spinBox.value()),
-        ))
+    def currentConfig(self):
+        return {
+            'enabled': self.isChecked(),
+            'comparator': self.comparators.currentText(),
+            'value': self.spinBox.value(),
+        }
+
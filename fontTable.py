@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import random
+import sys
+from aqt.qt import QFontDatabase
+from .utils import userFilePath
+
+writingSystems = {QFontDatabase.writingSystemName(v): v for v in QFontDatabase.writingSystems()}
+writingSystems = dict(sorted(writingSystems.items()))  # Sort alphabetically by language name rather than int value
+
+
+def fontDirectories():
+    home = os.path.expanduser('~')
+    if sys.platform.startswith('win'):
+        return [
+            os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts'),
+            os.path.join(os.environ.get('LOCALAPPDATA', home), 'Microsoft', 'Windows', 'Fonts'),
+        ]
+    if sys.platform == 'darwin':
+        return ['/System/Library/Fonts', '/Library/Fonts', os.path.join(home, 'Library', 'Fonts')]
+    return [
+        '/usr/share/fonts',
+        '/usr/local/share/fonts',
+        os.path.join(home, '.fonts'),
+        os.path.join(home, '.local', 'share', 'fonts'),
+    ]
+
+
+def fontFingerprint():
+    '''
+    A cheap summary of the installed fonts: the mtime and entry count of every font directory, plus every family
+    Qt knows. Installing or removing a font changes the mtime of the directory it lives in. The family list also
+    covers fonts the directories miss, such as fonts registered with addApplicationFont (by Anki or other add-ons)
+    and directories configured through fontconfig. No font files are opened.
+    '''
+    digest = hashlib.sha1(repr(list(writingSystems.values())).encode())
+    digest.update('\n'.join(sorted(QFontDatabase.families())).encode())
+    for root in fontDirectories():
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            try:
+                mtime = os.stat(dirpath).st_mtime_ns
+            except OSError:
+                continue
+            digest.update(f'{dirpath}|{mtime}|{len(filenames)}\n'.encode())
+    return digest.hexdigest()
+
+
+class FontCatalog():
+    '''
+    The font families Qt reports for each writing system, saved in user_files. Enumerating fonts is slow on
+    machines with many installed, so the saved catalog is reused until the fingerprint of the installed fonts changes.
+    Languages are still only enumerated the first time they're needed.
+    '''
+    fileName = 'fontCatalog.json'
+
+    def __init__(self):
+        self.families = None
+        self.dirty = False
+
+    def load(self):
+        self.fingerprint = fontFingerprint()
+        try:
+            with open(userFilePath(self.fileName), encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = {}
+        if saved.get('fingerprint') == self.fingerprint:
+            self.families = saved['families']
+        else:
+            self.families = {}
+
+    def get(self, language):
+        if self.families is None:
+            self.load()
+        if language not in self.families:
+            self.families[language] = QFontDatabase.families(writingSystems[language])
+            self.dirty = True
+        return self.families[language]
+
+    def save(self):
+        if not self.dirty:
+            return
+        with open(userFilePath(self.fileName), 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': self.fingerprint, 'families': self.families}, f)
+        self.dirty = False
+
+
+fontCatalog = FontCatalog()
+
+
+class FontTable():
+    '''
+    The fonts enabled for each language, read straight from config. Installed fonts are only enumerated for a
+    language the first time a card actually uses it, rather than for every writing system at startup.
+    '''
+
+    def __init__(self, languagesConfig):
+        self.config = languagesConfig
+        self.systemFont = None
+        self.reload()
+
+    def reload(self):
+        self.saved = self.config.read()
+        self.fonts = {}
+
+    def enabledFonts(self, language):
+        if language not in self.fonts:
+            # Fonts missing from the config haven't been seen by the config GUI yet, so are enabled by default
+            saved = self.saved.get(language, {})
+            families = fontCatalog.get(language)
+            fontCatalog.save()
+            self.fonts[language] = tuple(font for font in families if saved.get(font, True))
+        return self.fonts[language]
+
+    def setEnabledFonts(self, language, fonts):
+        ''' Replace a language's fonts with ones the config GUI already has on hand, rather than rereading config. '''
+        self.fonts[language] = tuple(fonts)
+
+    def chooseFont(self, language):
+        enabledFonts = self.enabledFonts(language)
+        if enabledFonts:
+            return random.choice(enabledFonts)
+        # Fallback to default font
+        if self.systemFont is None:
+            self.systemFont = QFontDatabase.systemFont(QFontDatabase.GeneralFont).family()
+        return self.systemFont
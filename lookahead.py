@@ -0,0 +1,126 @@
+import json
+import re
+from functools import partial
+from aqt import mw, gui_hooks
+from .runtime import usedLanguages
+from .utils import strip_tags
+
+# Fills an off-screen, invisible element outside #qa with the next card's text in each of its chosen fonts, so the
+# webview opens and decodes those fonts while the current card is still up. Replaced every card, never removed.
+preloadScript = '''(function(fonts, sample) {
+    var preload = document.getElementById("randomFontPreload");
+    if (!preload) {
+        preload = document.createElement("div");
+        preload.id = "randomFontPreload";
+        preload.setAttribute("aria-hidden", "true");
+        preload.style.cssText = "position:absolute;left:-10000px;top:0;visibility:hidden;pointer-events:none;";
+        document.body.appendChild(preload);
+    }
+    preload.replaceChildren(...fonts.map(function(font) {
+        var span = document.createElement("span");
+        span.style.fontFamily = JSON.stringify(font);
+        span.textContent = sample;
+        return span;
+    }));
+})(%s, %s);'''
+templateTagPattern = re.compile(r'{{(.*?)}}', re.DOTALL)
+# strip_tags keeps what's inside these, which is CSS or code rather than anything shown on the card
+hiddenContentPattern = re.compile(r'<(style|script)\b.*?</\1\s*>', re.DOTALL | re.IGNORECASE)
+
+
+def fillTemplate(qfmt, fields):
+    '''
+    A card's question without rendering it: the note's fields put into the template, with filters (text:,
+    furigana:, cloze:, ...) ignored and conditional sections kept. Rendering would run other add-ons' hooks,
+    which expect the main thread. Special fields such as {{Tags}} and {{Deck}} are left empty.
+    '''
+    def replace(match):
+        tag = match.group(1).strip()
+        if tag[:1] in ('#', '/', '^', '!'):
+            return ''
+        return fields.get(tag.split(':')[-1].strip(), '')
+    return templateTagPattern.sub(replace, qfmt)
+
+
+class ReviewLookahead():
+    '''
+    While a question is up, works out whether the reviewer's next few cards match and which languages they use,
+    on a worker thread. The decisions go into the runtime's match cache and fonts are picked for the matching
+    cards, so when one of them comes up the hook has little left to do but build the payload. The next card's
+    fonts are also loaded in the webview ahead of time, so it's painted without a flash of fallback text.
+    '''
+    depth = 3
+    sampleLength = 200  # Characters of the next card's text rendered in each font to warm it
+
+    def __init__(self, runtime):
+        self.runtime = runtime
+        self.running = False
+
+    def register(self):
+        gui_hooks.reviewer_did_show_question.append(self.questionShown)
+
+    def unhook(self):
+        gui_hooks.reviewer_did_show_question.remove(self.questionShown)
+
+    def questionShown(self, card):
+        if self.running:  # Reviewing faster than the lookahead keeps up, so skip a round
+            return
+        self.running = True
+        ruleVersion = self.runtime.ruleVersion
+        work = partial(self.prepare, self.runtime.dispatcher, ruleVersion, card.id)
+        mw.taskman.run_in_background(work, partial(self.prepared, ruleVersion))
+
+    def prepare(self, dispatcher, ruleVersion, currentCid):
+        '''
+        Runs on a worker thread. Only reads the collection through the backend, and never renders a card. The
+        languages come from the note's fields filled into the question template, which can differ from the real
+        question (a hidden conditional section, another add-on's filter). Such a card then just misses the match
+        cache and the hook works it out itself.
+        '''
+        results = []
+        # The card being shown stays at the front of the queue until it's answered
+        for queuedCard in mw.col.sched.get_queued_cards(fetch_limit=self.depth + 1).cards:
+            if queuedCard.card.id == currentCid:
+                continue
+            card = mw.col.get_card(queuedCard.card.id)
+            question = fillTemplate(card.template()['qfmt'], dict(card.note().items()))
+            usedInCard = usedLanguages(question)
+            key = self.runtime.matchKey(card, ruleVersion, usedInCard)
+            # Cards already prepared in an earlier round (or shown before) aren't matched again
+            known = key in self.runtime.matchCache
+            panel = None if known else dispatcher.matchingPanel(card, usedInCard)
+            sample = strip_tags(hiddenContentPattern.sub('', question))[:self.sampleLength]
+            results.append((card.id, key, known, panel, usedInCard, sample))
+        return results[:self.depth]
+
+    def prepared(self, ruleVersion, future):
+        ''' Back on the main thread, which owns the match cache, the font table and the webview. '''
+        self.running = False
+        try:
+            results = future.result()
+        except Exception:
+            # Only an optimisation: the hook works everything out itself for cards that weren't prepared
+            return
+        if ruleVersion != self.runtime.ruleVersion:  # The rule or collection changed in the meantime
+            return
+        previousFonts = self.runtime.upcomingFonts
+        upcomingFonts = {}
+        for cid, key, known, panel, usedInCard, sample in results:
+            if known:
+                panel = self.runtime.matchCache.get(key)
+                if panel is None:  # Evicted in the meantime
+                    continue
+            else:
+                self.runtime.matchCache.put(key, panel or False)
+            if panel:
+                upcomingFonts[cid] = previousFonts.get(cid) or self.runtime.chooseFonts(panel.filterLanguages(usedInCard))
+        self.runtime.upcomingFonts = upcomingFonts
+        if results and results[0][0] in upcomingFonts:
+            cid, key, known, panel, usedInCard, sample = results[0]
+            self.preloadFonts(upcomingFonts[cid].values(), sample)
+
+    def preloadFonts(self, fonts, sample):
+        if mw.state != 'review' or mw.reviewer.web is None:
+            return
+        fonts = sorted(set(fonts))
+        mw.reviewer.web.eval(preloadScript % (json.dumps(fonts), json.dumps(sample)))
@@ -0,0 +1,88 @@
+import functools
+import re
+
+try:
+    from re import _parser as sreParse, _constants as sreConstants
+except ImportError:  # Before Python 3.11
+    import sre_parse as sreParse, sre_constants as sreConstants
+
+# Every pattern typed into a finder goes through here. Most are plain text like "Japanese" or "Core2k", or a
+# whole name like "^Expression$", which are matched without the regex engine. Everything else, including
+# "^Core" and "verb$", goes to re: startswith/endswith called through a Python method measured no faster than
+# a compiled regex. Regexes are compiled once and cached.
+
+metaCharacters = frozenset('.^$*+?{}[]\\|()')
+repeatOps = tuple(op for op in (sreConstants.MAX_REPEAT, sreConstants.MIN_REPEAT, getattr(sreConstants, 'POSSESSIVE_REPEAT', None)) if op)
+compileCacheSize = 512
+
+
+class LiteralPattern():
+    ''' Base for patterns with no regex syntax. Like a compiled regex, has .pattern and a truthy .search(). '''
+
+    def __init__(self, pattern, text):
+        self.pattern = pattern
+        self.text = text
+
+
+class ContainsPattern(LiteralPattern):
+    def search(self, string):
+        return self.text in string
+
+
+class ExactPattern(LiteralPattern):
+    def __init__(self, pattern, text):
+        super().__init__(pattern, text)
+        # A set's own __contains__ avoids a Python level call. $ also matches just before a trailing newline.
+        self.search = frozenset((text, text + '\n')).__contains__
+
+
+@functools.lru_cache(maxsize=compileCacheSize)
+def compilePattern(pattern):
+    ''' A literal pattern for plain text, or plain text between ^ and $, else re.compile. '''
+    anchoredStart = pattern.startswith('^')
+    anchoredEnd = pattern.endswith('$') and len(pattern) > anchoredStart
+    text = pattern[anchoredStart:len(pattern) - anchoredEnd]
+    if metaCharacters.isdisjoint(text) and anchoredStart == anchoredEnd:
+        return ExactPattern(pattern, text) if anchoredStart else ContainsPattern(pattern, text)
+    return re.compile(pattern)
+
+
+def patternError(pattern):
+    ''' Why the pattern isn't a valid regex, or None if it is. '''
+    try:
+        compilePattern(pattern)
+    except re.error as e:
+        return f'"{pattern}" is not a valid regex: {e}'
+    return None
+
+
+def requiredLiterals(pattern):
+    '''
+    Substrings that every match of the regex has to contain, read off its parse tree. Only used to narrow down
+    candidates before the regex itself is run, so it's fine to miss some (an empty list narrows nothing).
+    '''
+    try:
+        parsed = sreParse.parse(pattern)
+    except re.error:
+        return []
+    literals = []
+    collectLiterals(parsed, bool(parsed.state.flags & re.IGNORECASE), literals)
+    return literals
+
+
+def collectLiterals(items, ignoreCase, literals):
+    run = []
+    for op, av in list(items) + [(None, None)]:  # The sentinel ends the last run
+        if op == sreConstants.LITERAL:
+            run.append(chr(av))
+            continue
+        # Case-insensitive matching of non-ASCII text can differ from SQLite's case folding, so don't rely on it
+        literal = ''.join(run)
+        if literal and (literal.isascii() or not ignoreCase):
+            literals.append(literal)
+        run = []
+        if op == sreConstants.SUBPATTERN:
+            addFlags = av[1] if len(av) == 4 else 0
+            collectLiterals(av[-1], ignoreCase or bool(addFlags & re.IGNORECASE), literals)
+        elif op in repeatOps and av[0] >= 1:  # Repeated at least once, so whatever it requires is required
+            collectLiterals(av[2], ignoreCase, literals)
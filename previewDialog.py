@@ -0,0 +1,143 @@
+from functools import partial
+from aqt import mw
+from aqt.qt import Qt, QAbstractTableModel, QModelIndex, QDialog, QVBoxLayout, QHBoxLayout, QLabel, QProgressBar, QTableView, QPushButton
+from .finderRules import CardContext
+
+
+def candidateCards(rule):
+    ''' Run the rule's prefilter search in Anki. Returns the card ids found and the residual rule (or None). '''
+    search, residualRule = rule.prefilter()
+    return mw.col.find_cards(search), residualRule
+
+
+def confirmMatches(residualRule, cids):
+    ''' The candidate cards that also pass the residual rule. '''
+    if residualRule is None:
+        return cids
+    return [cid for cid in cids if residualRule.confirmMatch(mw.col.get_card(cid))]
+
+
+class PreviewResultsModel(QAbstractTableModel):
+    '''
+    Table of matching cards. Only card ids are kept for every result; the deck, note and tags shown in a row are
+    looked up in batches as the view scrolls to them (Qt's canFetchMore/fetchMore pattern).
+    '''
+    headers = ('Card', 'Deck', 'Sort Field', 'Note Type', 'Tags')
+    batchSize = 100
+
+    def __init__(self):
+        super().__init__()
+        self.cids = []
+        self.rows = []
+
+    def addCids(self, cids):
+        # Rows are only added by fetchMore, so a view that isn't scrolled doesn't pay for the new results
+        self.cids.extend(cids)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole or not index.isValid():
+            return None
+        return self.rows[index.row()][index.column()]
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.headers[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and len(self.rows) < len(self.cids)
+
+    def fetchMore(self, parent=QModelIndex()):
+        start = len(self.rows)
+        cids = self.cids[start:start + self.batchSize]
+        self.beginInsertRows(QModelIndex(), start, start + len(cids) - 1)
+        self.rows.extend(self.describeCard(cid) for cid in cids)
+        self.endInsertRows()
+
+    def describeCard(self, cid):
+        # The same lazily loaded lookups the finders use, so the note is only loaded once per row
+        context = CardContext(mw.col.get_card(cid))
+        sortField = context.fields[context.noteType['sortf']]
+        return (str(cid), context.deckName, f'{sortField[0]}: {sortField[1]}', context.noteType['name'], ' '.join(context.tags))
+
+
+class PreviewDialog(QDialog):
+    ''' Runs a panel's search in the background, streaming matches into the table as they are found. '''
+    chunkSize = 500
+
+    def __init__(self, rule, parent=None):
+        super().__init__(parent)
+        self.rule = rule
+        self.cancelled = False
+        self.matchCount = 0
+        self.buildGUI()
+
+    def buildGUI(self):
+        self.setWindowTitle('Search Preview')
+        self.layout = QVBoxLayout(self)
+        self.statusLbl = QLabel('Searching...')
+        self.progressBar = QProgressBar()
+        self.model = PreviewResultsModel()
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.cancelBtn = QPushButton('Cancel')
+        self.closeBtn = QPushButton('Close')
+
+        self.cancelBtn.pressed.connect(self.cancel)
+        self.closeBtn.pressed.connect(self.close)
+
+        self.btnLayout = QHBoxLayout()
+        self.btnLayout.addWidget(self.cancelBtn)
+        self.btnLayout.addWidget(self.closeBtn)
+        self.layout.addWidget(self.statusLbl)
+        self.layout.addWidget(self.progressBar)
+        self.layout.addWidget(self.table)
+        self.layout.addLayout(self.btnLayout)
+        self.resize(800, 500)
+
+    def start(self):
+        mw.taskman.run_in_background(self.search, self.searchDone)
+
+    def search(self):
+        ''' Runs on a background thread. Results are handed to the GUI thread a chunk at a time. '''
+        cids, residualRule = candidateCards(self.rule)
+        mw.taskman.run_on_main(partial(self.progressBar.setMaximum, len(cids)))
+        for start in range(0, len(cids), self.chunkSize):
+            if self.cancelled:
+                return
+            chunk = confirmMatches(residualRule, cids[start:start + self.chunkSize])
+            mw.taskman.run_on_main(partial(self.addResults, chunk, start + self.chunkSize))
+
+    def addResults(self, cids, progress):
+        if self.cancelled:
+            return
+        self.matchCount += len(cids)
+        self.model.addCids(cids)
+        # Fill the first page without waiting for a scroll. After that the view asks for more as needed.
+        if self.model.rowCount() < self.model.batchSize and self.model.canFetchMore():
+            self.model.fetchMore()
+        self.progressBar.setValue(min(progress, self.progressBar.maximum()))
+        self.statusLbl.setText(f'{self.matchCount} results so far...')
+
+    def searchDone(self, future):
+        self.cancelBtn.setEnabled(False)
+        if self.cancelled:
+            self.statusLbl.setText(f'Cancelled after {self.matchCount} results')
+            return
+        future.result()  # Re-raise anything that went wrong in the background
+        self.progressBar.setValue(self.progressBar.maximum())
+        self.statusLbl.setText(f'{self.matchCount} results')
+
+    def cancel(self):
+        self.cancelled = True
+
+    def closeEvent(self, event):
+        self.cancel()
+        super().closeEvent(event)
@@ -0,0 +1,43 @@
+from aqt import mw, gui_hooks
+from .diagnostics import timed
+
+
+class PassIndex():
+    '''
+    Number of passing reviews (ease > 1) for every card, built with a single grouped revlog query.
+    Shared by the Success Rate and # of Passes finders instead of querying the revlog per card.
+    '''
+
+    def __init__(self):
+        self.passes = None  # Built lazily, since the collection isn't open yet when the add-on loads
+
+    def register(self):
+        gui_hooks.reviewer_did_answer_card.append(self.cardAnswered)
+        gui_hooks.collection_did_load.append(self.invalidate)
+        gui_hooks.state_did_undo.append(self.invalidate)
+        gui_hooks.sync_did_finish.append(self.invalidate)
+
+    @timed('PassIndex.build')
+    def build(self):
+        rows = mw.col.db.all('SELECT cid, count() FROM revlog WHERE ease > 1 GROUP BY cid')
+        passes = self.passes = {cid: count for cid, count in rows}
+        return passes
+
+    def get(self, cid):
+        # Read once, since the review lookahead calls this from a worker thread while the main thread may invalidate
+        passes = self.passes
+        if passes is None:
+            passes = self.build()
+        return passes.get(cid, 0)
+
+    def invalidate(self, *args):
+        self.passes = None
+
+    def cardAnswered(self, reviewer, card, ease):
+        # Keep the index current without rebuilding it. If it hasn't been built yet the next build includes this answer.
+        passes = self.passes
+        if passes is not None and ease > 1:
+            passes[card.id] = passes.get(card.id, 0) + 1
+
+
+passIndex = PassIndex()
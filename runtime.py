@@ -0,0 +1,197 @@
+import functools
+import re
+from collections import namedtuple
+from aqt import gui_hooks, mw
+from .diagnostics import instrumentation, timed
+from .featureIndex import noteFeatureIndex
+from .finderRules import FinderDispatcher
+from .fontTable import FontTable, writingSystems
+from .revlogIndex import passIndex
+from .utils import ConfigPath, LRUCache
+
+# NOTE CardLayout appears to pass 0 rather than the real card.id to card_will_show,
+#   so don't think we can edit text in cardlayout?
+
+# Templates for what's added to the card. Kept compact since the webview parses them on every card flip.
+tooltipTemplate = '<span id="{name}FontName" class="tippyhover" style="display:none;"><ruby><rb>{language}Font</rb><rt>{font}</rt></ruby></span>'
+styleRuleTemplate = '.{language}{{font-family:{font};}}'
+scriptVarsTemplate = 'var {name}ChosenFont="{font}";var {name}Tooltip=document.getElementById("{name}FontName");'
+# If the stylesheet is added to qa instead of document, it gets deleted when a new card is shown, which is what I want.
+# The answer side replaces qa, so the stylesheet and tooltips from the question are put back into it.
+styleStart = '<style id="randomFontStyleSheet">'
+scriptStart = '</style><script>var qa=document.getElementById("qa");var randomFontStyleSheet=document.getElementById("randomFontStyleSheet");'
+scriptEnd = '</script>'
+answerTemplate = '<script>qa.append(...{names}.map(n=>window[n+"Tooltip"]).filter(Boolean),randomFontStyleSheet);</script>'
+nonIdentifierPattern = re.compile(r'\W')
+classAttributePattern = re.compile(r'''(?<![\w-])class\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+))''', re.IGNORECASE)
+
+
+def usedLanguages(text):
+    '''
+    The languages used as a class somewhere in the card's HTML, found in a single pass over it. Only class
+    attributes count, so the name of a language in the card's text doesn't.
+    '''
+    values = [''.join(quotedOrNot).strip() for quotedOrNot in classAttributePattern.findall(text)]
+    classes = set(' '.join(values).split())
+    classes.update(values)  # For language names with a space in them, e.g. "Simplified Chinese"
+    return sorted(classes.intersection(writingSystems))
+
+
+def scriptName(language):
+    ''' The language's name as used in JavaScript variable and element ids. '''
+    return nonIdentifierPattern.sub('_', language)
+
+
+@functools.cache
+def languageTemplates(language):
+    '''
+    The tooltip, css rule and script variables for a language, with everything but the font already filled in.
+    Each is split around the font, so a card only has to join strings together.
+    '''
+    name = scriptName(language)
+    marker = '\0'
+    return tuple(
+        tuple(template.format(name=name, language=language, font=marker).split(marker))
+        for template in (tooltipTemplate, styleRuleTemplate, scriptVarsTemplate)
+    )
+
+
+# What was decided when a card's question was shown, so the answer side can reuse it. fonts maps language -> font.
+RenderContext = namedtuple('RenderContext', ('cardId', 'cardMod', 'doesMatch', 'fonts'))
+
+
+class RandomFontRuntime():
+    '''
+    Everything the reviewer hook needs (the compiled searches of every panel and the enabled fonts), loaded
+    straight from config. None of the config GUI is built until the user opens it.
+    '''
+    panelName = 'RandomFont'  # The panel the config GUI starts with when there are none yet
+    matchCacheSize = 4096
+
+    def __init__(self):
+        self.config = ConfigPath()
+        self.panelsConfig = self.config.addBranch('panels')
+        self.languagesConfig = self.config.addBranch('languages')
+        self.diagnosticsConfig = self.config.addBranch('diagnostics', {'enabled': False})
+        self.fontTable = FontTable(self.languagesConfig)
+        # The matching panel (or False) keyed by card id, card/note mod times, rule version and languages used
+        self.matchCache = LRUCache(self.matchCacheSize)
+        self.ruleVersion = 0
+        self.renderContext = None
+        self.upcomingFonts = {}  # Card id -> fonts already chosen for it by the review lookahead
+        self.reload()
+
+    def register(self):
+        gui_hooks.card_will_show.append(self.checkCard)
+        gui_hooks.operation_did_execute.append(self.operationExecuted)
+        gui_hooks.collection_did_load.append(self.collectionLoaded)
+        passIndex.register()
+        noteFeatureIndex.register()
+
+    def unhook(self):
+        gui_hooks.card_will_show.remove(self.checkCard)
+        gui_hooks.operation_did_execute.remove(self.operationExecuted)
+        gui_hooks.collection_did_load.remove(self.collectionLoaded)
+
+    def operationExecuted(self, changes, handler):
+        # Renaming or adding decks, note types and tags changes what the rules match without touching any card
+        if changes.deck or changes.notetype or changes.tag:
+            self.collectionChanged()
+
+    def collectionLoaded(self, col):
+        self.collectionChanged()
+
+    def collectionChanged(self):
+        self.dispatcher.invalidate()
+        self.ruleVersion += 1
+        self.matchCache.clear()
+
+    def reload(self):
+        ''' Recompile the search and reread the enabled fonts from config. '''
+        self.reloadRule()
+        self.fontTable.reload()
+        instrumentation.enabled = self.diagnosticsConfig.read('enabled')
+
+    def reloadRule(self):
+        try:
+            self.dispatcher = FinderDispatcher.fromConfig(self.panelsConfig.read())
+        except re.error:
+            # Only possible if the config was edited by hand, since the config GUI won't save an invalid pattern.
+            # Matching nothing is better than raising inside the reviewer hook on every card.
+            self.dispatcher = FinderDispatcher([])
+        self.ruleVersion += 1
+        self.matchCache.clear()
+        self.renderContext = None
+        self.upcomingFonts = {}
+
+    @timed('checkCard')
+    def checkCard(self, text, card, kind):
+        if kind in ('reviewQuestion', 'previewQuestion'):
+            return self.showQuestion(text, card)
+        elif kind in ('reviewAnswer', 'previewAnswer'):
+            return self.showAnswer(text, card)
+        return text
+
+    def showQuestion(self, text, card):
+        languages = usedLanguages(text)
+        panel = self.cachedMatch(card, languages)
+        chosen = self.upcomingFonts.pop(card.id, {})
+        fonts = self.chooseFonts(panel.filterLanguages(languages), chosen) if panel else {}
+        self.renderContext = RenderContext(card.id, card.mod, bool(panel), fonts)
+        if not panel:
+            return text
+        return self.modifyQ(text, fonts)
+
+    def showAnswer(self, text, card):
+        context = self.renderContext
+        if context is None or context.cardId != card.id or context.cardMod != card.mod:
+            # The question wasn't shown through us (or the card changed since), so work it out from scratch
+            languages = usedLanguages(text)
+            panel = self.cachedMatch(card, languages)
+            languages = panel.filterLanguages(languages) if panel else []
+            context = RenderContext(card.id, card.mod, bool(panel), dict.fromkeys(languages))
+        if not context.doesMatch:
+            return text
+        return self.modifyA(text, context.fonts)
+
+    def chooseFonts(self, languages, chosen={}):
+        ''' A font for each language, reusing any already chosen ahead of time. '''
+        return {language: chosen.get(language) or self.fontTable.chooseFont(language) for language in languages}
+
+    def matchKey(self, card, ruleVersion, languages):
+        noteMod = mw.col.db.scalar('SELECT mod FROM notes WHERE id = ?', card.nid)
+        return (card.id, card.mod, noteMod, ruleVersion, tuple(languages))
+
+    def cachedMatch(self, card, languages):
+        '''
+        The highest priority panel matching the card that uses its languages (or None), reusing the decision from
+        the last time this card was shown if nothing changed.
+        '''
+        key = self.matchKey(card, self.ruleVersion, languages)
+        panel = self.matchCache.get(key)
+        if panel is None:
+            panel = self.dispatcher.matchingPanel(card, languages) or False
+            self.matchCache.put(key, panel)
+        return panel or None
+
+    @timed('modifyQ')
+    def modifyQ(self, text, fonts):
+        # Gathered into three sections (hidden tooltips, one <style>, one <script>) and joined only once
+        tooltips = []
+        styles = [styleStart]
+        scriptVars = [scriptStart]
+        for language, font in fonts.items():
+            tooltip, styleRule, scriptVar = languageTemplates(language)
+            # Add a hidden tooltip to show name of font. User to show it with css if wanted.
+            tooltips.append(font.join(tooltip))
+            # Add css rule to apply the random font to things with the language name as a class
+            styles.append(font.join(styleRule))
+            scriptVars.append(font.join(scriptVar))
+        scriptVars.append(scriptEnd)
+        return ''.join((text, *tooltips, *styles, *scriptVars))
+
+    @timed('modifyA')
+    def modifyA(self, text, languages):
+        # Script names are plain identifiers, so need no escaping in a JS array
+        names = '","'.join(scriptName(language) for language in languages)
+        return text + answerTemplate.format(names=f'["{names}"]' if names else '[]')
@@ -0,0 +1,161 @@
+'''
+Checks of how finder panels evaluate their finders, run outside of Anki with the stand-ins from benchmarks/.
+Uses unittest rather than pytest, which would import the add-on's own __init__ (the repository root) first.
+
+    python -m unittest discover tests
+'''
+import glob
+import os
+import random
+import sys
+import types
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+import fakeAnki
+import fakeCollection
+
+finderRules = fakeAnki.importAddonModule('finderRules')
+previewDialog = fakeAnki.importAddonModule('previewDialog')
+revlogIndex = fakeAnki.importAddonModule('revlogIndex')
+utils = fakeAnki.importAddonModule('utils')
+
+# Finder configs for the prefilter checks, mixing exact, inexact and untranslatable rules
+widgetChoices = {
+    'Deck Name (regex)': [{'enabled': True, 'text': 'Japanese'}, {'enabled': True, 'text': '^Chinese::HSK1$'}],
+    'Note Type (regex)': [{'enabled': True, 'text': 'Core2k'}, {'enabled': True, 'text': 'Basic|Cloze'}],
+    'Card States': [{'enabled': True, 'options': [0]}, {'enabled': True, 'options': [1, 2, 3]}],
+    'Tags (regex)': [{'enabled': True, 'text': 'verb', 'logic': 0}, {'enabled': True, 'text': '^JLPT Core', 'logic': 1}],
+    'Success Rate': [{'enabled': True, 'comparator': '>=', 'value': 80}],
+    '# of Passes': [{'enabled': True, 'comparator': '<', 'value': 3}],
+    'Field': [
+        {'enabled': True, 'nameText': 'Expression|Vocabulary-Kanji', 'contentsEnabled': True, 'contentsText': '勉強'},
+        {'enabled': True, 'nameText': '^Front$', 'lengthEnabled': True, 'lengthComparator': '<=', 'lengthValue': 8, 'useIndex': True},
+    ],
+}
+
+
+class CountingRule(finderRules.MetaFinderRule):
+    ''' A finder with a fixed result that counts how often it's checked. '''
+
+    def __init__(self, cost, result):
+        self.cost = cost
+        self.result = result
+        self.calls = 0
+
+    def checkMatch(self, context):
+        self.calls += 1
+        return self.result
+
+
+def fakeCard():
+    return types.SimpleNamespace(id=1, nid=1, did=1, odid=0, queue=0, reps=0)
+
+
+class FinderPanelRuleTest(unittest.TestCase):
+
+    def check(self, logic, rules, negate=False):
+        return finderRules.FinderPanelRule(logic, negate, rules).confirmMatch(fakeCard())
+
+    def testOrStopsAtCheapMatch(self):
+        expensive, cheap = CountingRule(4, True), CountingRule(1, True)
+        self.assertTrue(self.check('or', [expensive, cheap]))
+        self.assertEqual((cheap.calls, expensive.calls), (1, 0))
+
+    def testAndStopsAtCheapMismatch(self):
+        expensive, cheap = CountingRule(4, True), CountingRule(1, False)
+        self.assertFalse(self.check('and', [expensive, cheap]))
+        self.assertEqual((cheap.calls, expensive.calls), (1, 0))
+
+    def testNegationStillShortCircuits(self):
+        expensive, cheap = CountingRule(4, False), CountingRule(1, True)
+        self.assertFalse(self.check('or', [expensive, cheap], negate=True))
+        self.assertEqual(expensive.calls, 0)
+
+    def testUndecidedChecksEveryRuleOnce(self):
+        rules = [CountingRule(4, False), CountingRule(2, False), CountingRule(1, False)]
+        self.assertFalse(self.check('or', rules))
+        self.assertEqual([r.calls for r in rules], [1, 1, 1])
+        rules = [CountingRule(4, True), CountingRule(2, True), CountingRule(1, True)]
+        self.assertTrue(self.check('and', rules))
+        self.assertEqual([r.calls for r in rules], [1, 1, 1])
+
+    def testMixedRuleSetInvocations(self):
+        # Over many cards, the expensive finder only runs for the cards the cheap one doesn't decide
+        cheapResults = [True, False, False, True, False]
+        cheap, expensive = CountingRule(1, None), CountingRule(4, True)
+        panel = finderRules.FinderPanelRule('or', False, [expensive, cheap])
+        for result in cheapResults:
+            cheap.result = result
+            panel.confirmMatch(fakeCard())
+        self.assertEqual(cheap.calls, len(cheapResults))
+        self.assertEqual(expensive.calls, cheapResults.count(False))
+
+
+
+class FinderDispatcherTest(unittest.TestCase):
+
+    def testPanelForOtherLanguagesIsPassedOver(self):
+        kanjiRule, everythingRule = CountingRule(1, True), CountingRule(1, True)
+        kanji = finderRules.FinderPanelRule('or', False, [kanjiRule], 'Kanji fields', 3, ['Japanese'])
+        everything = finderRules.FinderPanelRule('or', False, [everythingRule], 'Everything', 1)
+        dispatcher = finderRules.FinderDispatcher([everything, kanji])
+        self.assertIs(dispatcher.matchingPanel(fakeCard(), ['Korean']), everything)
+        self.assertEqual(kanjiRule.calls, 0)
+        self.assertIs(dispatcher.matchingPanel(fakeCard(), ['Japanese', 'Korean']), kanji)
+        self.assertIs(dispatcher.matchingPanel(fakeCard(), []), everything)
+
+
+class PrefilterTest(unittest.TestCase):
+    ''' A panel's prefilter search plus its residual rule must find exactly the cards confirmMatch accepts. '''
+    profileName = 'prefilterTest'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.col = fakeCollection.buildCollection(1500, seed=5)
+        fakeAnki.useCollection(cls.col, cls.profileName)
+        revlogIndex.passIndex.invalidate()
+        cls.cards = [cls.col.get_card(cid) for cid in cls.col.find_cards(finderRules.allCardsSearch)]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.col.close()
+        for path in glob.glob(utils.userFilePath(f'noteFeatures-{cls.profileName}.sqlite*')):
+            os.remove(path)
+
+    def assertPrefilterExact(self, config):
+        panel = finderRules.FinderPanelRule.fromConfig(config)
+        cids, residualRule = previewDialog.candidateCards(panel)
+        found = set(previewDialog.confirmMatches(residualRule, cids))
+        expected = {card.id for card in self.cards if panel.confirmMatch(card)}
+        self.assertEqual(found, expected, config)
+
+    def testNegatedOrWithInexactRule(self):
+        self.assertPrefilterExact({'logic': 0, 'negate': True, 'widgets': {
+            'Deck Name (regex)': widgetChoices['Deck Name (regex)'][0],
+            'Tags (regex)': widgetChoices['Tags (regex)'][0],
+        }})
+
+    def testAndWithoutTranslatableRules(self):
+        self.assertPrefilterExact({'logic': 1, 'widgets': {
+            'Success Rate': widgetChoices['Success Rate'][0],
+            '# of Passes': widgetChoices['# of Passes'][0],
+        }})
+
+    def testEmptyPanel(self):
+        self.assertPrefilterExact({})
+        self.assertPrefilterExact({'negate': True})
+
+    def testRandomPanels(self):
+        rng = random.Random(0)
+        for _ in range(40):
+            labels = rng.sample(sorted(widgetChoices), rng.randint(1, 3))
+            self.assertPrefilterExact({
+                'logic': rng.randint(0, 1),
+                'negate': rng.random() < 0.3,
+                'widgets': {label: rng.choice(widgetChoices[label]) for label in labels},
+            })
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,12 @@
+from collections import OrderedDict
+from html import unescape
 from html.parser import HTMLParser
 from io import StringIO
+import os
 import re
 from aqt import mw
 from aqt.qt import QWidget, QHBoxLayout, QGroupBox
+from .diagnostics import timed
 
 
 class MyGroupBox(QGroupBox):
@@ -35,6 +39,13 @@ class CollapsibleGroupBox(MyGroupBox):
             self.setStyleSheet('border:0;padding:0px;margin:0px;')
 
 
+def userFilePath(name):
+    ''' Path to a file in the add-on's user_files folder, which Anki keeps when the add-on is updated. '''
+    folder = os.path.join(os.path.dirname(__file__), 'user_files')
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, name)
+
+
 def listsToSet(lists, logic):
     ''' Take a list of lists and return a set that is either the intersection or the union of that. '''
     r = set([item for sublist in lists for item in sublist])  # set(Flatten list of lists)
@@ -46,6 +57,80 @@ def listsToSet(lists, logic):
         raise Exception('Invalid logic option')
 
 
+class LRUCache():
+    ''' A bounded mapping that evicts the least recently used entry and counts its hits and misses. '''
+
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self.entries[key]
+            self.entries.move_to_end(key)
+        except KeyError:  # Missing, or evicted by another thread in between
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        try:
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+        except KeyError:  # Evicted, or the cache emptied, by another thread in between
+            pass
+
+    def clear(self):
+        self.entries.clear()
+
+    def __contains__(self, key):
+        ''' Unlike get, counts as neither a hit nor a use, so a peek from another thread leaves the order alone. '''
+        return key in self.entries
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'maxSize': self.maxSize}
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class ConfigSnapshot():
+    '''
+    The add-on's whole config, read from disk the first time it's needed and shared by every ConfigPath. Writes
+    only change the snapshot; they reach meta.json when flush() is called, in a single write.
+    '''
+
+    def __init__(self):
+        self.config = None
+        self.dirty = False
+
+    def get(self):
+        if self.config is None:
+            self.config = mw.addonManager.getConfig(__name__)
+        return self.config
+
+    def markDirty(self):
+        self.dirty = True
+
+    def flush(self):
+        if self.dirty:
+            mw.addonManager.writeConfig(__name__, self.config)
+            self.dirty = False
+
+    def replace(self, config):
+        ''' Use config edited outside of the add-on (e.g. Anki's config editor), dropping any unflushed writes. '''
+        self.config = config
+        self.dirty = False
+
+
+configSnapshot = ConfigSnapshot()
+
+
 class ConfigPath():
     def __init__(self, parentBranch=None, key=None, defaults={}):
         self.parentBranch = parentBranch
@@ -70,10 +155,9 @@ class ConfigPath():
 
     def updateKey(self, newKey: str):
         # Move the key in the config file
-        config = mw.addonManager.getConfig(__name__)
-        root = self.descend(config, self.root)
+        root = self.descend(configSnapshot.get(), self.root)
         root[newKey] = root.pop(self.key)
-        mw.addonManager.writeConfig(__name__, config)
+        configSnapshot.markDirty()
 
         self.key = newKey
         self.path = self.root + [newKey]
@@ -96,32 +180,32 @@ class ConfigPath():
         return d
 
     def read(self, key: str = None):
-        config = mw.addonManager.getConfig(__name__)
-        root = self.descend(config)
+        root = self.descend(configSnapshot.get())
         if key:
-            return (self.defaults | root)[key]
+            return root[key] if key in root else self.defaults[key]
         return (self.defaults | root)
 
     def write(self, key: str, val):
-        config = mw.addonManager.getConfig(__name__)
-        root = self.descend(config)
+        root = self.descend(configSnapshot.get())
         root[key] = val
-        mw.addonManager.writeConfig(__name__, config)
+        configSnapshot.markDirty()
 
     def writes(self, pairs):
-        config = mw.addonManager.getConfig(__name__)
-        root = self.descend(config)
+        root = self.descend(configSnapshot.get())
         for key, val in pairs:
             root[key] = val
-        mw.addonManager.writeConfig(__name__, config)
+        configSnapshot.markDirty()
 
     def delete(self):
-        config = mw.addonManager.getConfig(__name__)
-        root = self.descend(config, self.root)
+        root = self.descend(configSnapshot.get(), self.root)
         del root[self.key]
-        mw.addonManager.writeConfig(__name__, config)
+        configSnapshot.markDirty()
         self.parentBranch.branches.remove(self)
 
+    def flush(self):
+        ''' Write everything written through any ConfigPath to disk. '''
+        configSnapshot.flush()
+
     def __iter__(self):
         return (x for x in self.path)
 
@@ -146,10 +230,55 @@ class MLStripper(HTMLParser):
         return self.text.getvalue()
 
 
-def strip_tags(html):
+furiganaPattern = re.compile(r'\[(.*?)\]')
+# Tags without anything unusual in them. Attribute values may be quoted, and quoted values may contain '>'.
+simpleTagPattern = re.compile(r'''</?([a-zA-Z][a-zA-Z0-9:-]*)(?=[\s/>])[^<>"']*(?:(?:"[^"<]*"|'[^'<]*')[^<>"']*)*>''')
+# A '<' that could start something other than a simple tag. Any other '<' is just text to HTMLParser.
+unsafeLtPattern = re.compile(r'<(?:[a-zA-Z/!?]|$)')
+# An '&' with no ';' or whitespace after it at the very end makes HTMLParser hold the data back
+trailingAmpPattern = re.compile(r'&[^\s;]*$')
+# Tags whose contents HTMLParser doesn't parse as HTML
+rawTextTags = frozenset(HTMLParser.CDATA_CONTENT_ELEMENTS) | frozenset(getattr(HTMLParser, 'RCDATA_CONTENT_ELEMENTS', ()))
+stripCache = LRUCache(8192)
+
+
+def fastStrip(html):
+    '''
+    Regex version of MLStripper for the HTML usually found in fields. Returns None for anything it can't be sure
+    it handles exactly like MLStripper (comments, malformed tags, script/style contents, ...).
+    '''
+    segments = []
+    start = 0
+    for match in simpleTagPattern.finditer(html):
+        if match.group(1).lower() in rawTextTags:
+            return None
+        segments.append(html[start:match.start()])
+        start = match.end()
+    segments.append(html[start:])
+    if any(unsafeLtPattern.search(s) for s in segments) or trailingAmpPattern.search(segments[-1]):
+        return None
+    # Charrefs are decoded per text segment, the same as HTMLParser does
+    return ''.join(unescape(s) if '&' in s else s for s in segments)
+
+
+def slowStrip(html):
     s = MLStripper()
     s.feed(html)
+    return s.get_data()
+
+
+def stripTagsUncached(html):
+    withFuri = fastStrip(html)
+    if withFuri is None:
+        withFuri = slowStrip(html)
     # Strip out furigana
-    withFuri = s.get_data()
-    withoutFuri = re.sub(r'\[(.*?)\]', '', withFuri)
+    return furiganaPattern.sub('', withFuri)
+
+
+@timed('strip_tags')
+def strip_tags(html):
+    withoutFuri = stripCache.get(html)
+    if withoutFuri is None:
+        withoutFuri = stripTagsUncached(html)
+        stripCache.put(html, withoutFuri)
     return withoutFuri